@@ -0,0 +1,313 @@
+import asyncio
+import collections
+import enum
+import time
+
+from metrics import Metrics
+
+
+class Priority(enum.IntEnum):
+    """ Lanes that Discord actions can be scheduled in. """
+    # Actions that a moderator is waiting on (commands)
+    HIGH = 0
+    # Actions from the background verification loop
+    LOW = 1
+    # Actions from bulk jobs started by a moderator (e.g. reverifying a role)
+    BULK = 2
+
+
+class RateBudget:
+    """
+    A token bucket allowing `rate` actions every `per` seconds.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.last_refill = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens +
+                          (now - self.last_refill) * self.rate / self.per)
+        self.last_refill = now
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available. Returns whether it did.
+        """
+        self.refill()
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+
+        return False
+
+    def seconds_until_token(self):
+        self.refill()
+        return max(1 - self.tokens, 0) * self.per / self.rate
+
+
+class ActionScheduler:
+    """
+    Runs Discord API actions on a fixed pool of workers.
+
+    Actions are queued in a high priority lane (commands), a low priority
+    lane (the verification loop) or a bulk lane (bulk jobs like reverifying a
+    role). Concurrency is limited per guild and per route within a guild, and
+    low priority actions also have to fit within a per-guild rate budget so
+    that they leave room for commands. Bulk actions have a separate budget and
+    concurrency limit of their own, sized for getting through a whole role
+    quickly rather than trickling along with the verification loop. One worker only
+    ever runs high priority actions, so commands never wait behind a backlog of
+    background work.
+
+    The low priority and bulk lanes are split into one queue per guild, which
+    are served round-robin. Actions are only taken from guilds with budget left, so a
+    guild with a large backlog never holds up workers (or other guilds) while
+    it waits for its budget.
+    """
+
+    def __init__(self, workers=6, guild_concurrency=2, route_concurrency=1,
+                 background_rate=5, background_per=5.0, bulk_rate=10, bulk_per=1.0,
+                 bulk_concurrency=4, metrics: Metrics = None):
+        self.worker_count = workers
+        self.guild_concurrency = guild_concurrency
+        self.route_concurrency = route_concurrency
+        self.background_rate = background_rate
+        self.background_per = background_per
+        self.bulk_rate = bulk_rate
+        self.bulk_per = bulk_per
+        self.bulk_concurrency = bulk_concurrency
+        self.metrics = metrics
+
+        self.high_lane = collections.deque()
+        # Guild id -> queued low priority actions, in round-robin order
+        self.low_lanes = collections.OrderedDict()
+        # Guild id -> queued bulk actions, in round-robin order
+        self.bulk_lanes = collections.OrderedDict()
+        self.condition = None
+        self.workers = []
+        # Timer waking the workers once a guild has budget again
+        self.wake_handle = None
+
+        self.guild_limits = {}
+        self.route_limits = {}
+        self.bulk_limits = {}
+        self.background_budgets = {}
+        self.bulk_budgets = {}
+        # (Priority, guild id) -> when the guild's next action in that lane
+        # started waiting for budget
+        self.budget_waits = {}
+
+    def submit(self, guild_id: int, route: str, action, priority=Priority.LOW):
+        """
+        Queues an action and returns a future for its result.
+
+        `action` is a callable returning the coroutine to run (e.g. a
+        `functools.partial` of `member.edit`), so that nothing is sent to
+        Discord before the action is actually scheduled.
+        """
+        self.ensure_started()
+
+        future = asyncio.get_event_loop().create_future()
+        queued = (guild_id, route, action, priority, future)
+
+        if priority == Priority.HIGH:
+            self.high_lane.append(queued)
+        else:
+            self.lanes(priority).setdefault(guild_id, collections.deque()).append(queued)
+
+        self.notify()
+
+        return future
+
+    def ensure_started(self):
+        if self.workers:
+            return
+
+        self.condition = asyncio.Condition()
+
+        # The first worker is reserved for high priority actions
+        for idx in range(self.worker_count):
+            self.workers.append(asyncio.ensure_future(
+                self.run_worker(high_only=idx == 0)))
+
+    def notify(self):
+        async def wake_workers():
+            async with self.condition:
+                self.condition.notify_all()
+
+        asyncio.ensure_future(wake_workers())
+
+    def wake_later(self, delay: float):
+        """
+        Wakes the workers after `delay` seconds, unless they are already
+        woken up before then.
+        """
+        loop = asyncio.get_event_loop()
+        when = loop.time() + delay
+
+        if self.wake_handle is not None:
+            if self.wake_handle.when() <= when:
+                return
+
+            self.wake_handle.cancel()
+
+        def wake():
+            self.wake_handle = None
+            self.notify()
+
+        self.wake_handle = loop.call_at(when, wake)
+
+    def close(self):
+        for worker in self.workers:
+            worker.cancel()
+
+        if self.wake_handle is not None:
+            self.wake_handle.cancel()
+            self.wake_handle = None
+
+        self.workers = []
+
+        # Anything left in the queues won't run anymore
+        for lane in [self.high_lane, *self.low_lanes.values(), *self.bulk_lanes.values()]:
+            while lane:
+                lane.popleft()[-1].cancel()
+
+        self.low_lanes.clear()
+        self.bulk_lanes.clear()
+
+    def lanes(self, priority: Priority):
+        """
+        Returns the per-guild queues of a background lane.
+        """
+        return self.bulk_lanes if priority == Priority.BULK else self.low_lanes
+
+    def budget(self, priority: Priority, guild_id: int):
+        """
+        Returns a guild's rate budget for a background lane.
+        """
+        if priority == Priority.BULK:
+            return self.bulk_budgets.setdefault(
+                guild_id, RateBudget(self.bulk_rate, self.bulk_per))
+
+        return self.background_budget(guild_id)
+
+    def background_budget(self, guild_id: int):
+        return self.background_budgets.setdefault(
+            guild_id, RateBudget(self.background_rate, self.background_per))
+
+    def background_capacity(self, guild_id: int, seconds: float):
+        """
+        Returns about how many low priority actions a guild's rate budget lets
+        through in the given number of seconds.
+        """
+        budget = self.background_budget(guild_id)
+        budget.refill()
+
+        return budget.tokens + max(seconds, 0) * budget.rate / budget.per
+
+    def next_background_action(self, priority=Priority.LOW):
+        """
+        Takes the next action of a background lane from the first guild (in
+        round-robin order) that has budget left, or returns None if no guild
+        has any.
+        """
+        now = time.monotonic()
+        lanes = self.lanes(priority)
+
+        for guild_id, lane in list(lanes.items()):
+            # Cancelled actions don't use up any budget
+            while lane and lane[0][-1].cancelled():
+                lane.popleft()
+
+            if not lane:
+                del lanes[guild_id]
+                continue
+
+            if not self.budget(priority, guild_id).try_acquire():
+                self.budget_waits.setdefault((priority, guild_id), now)
+                continue
+
+            # The guild goes to the back of the line
+            action = lane.popleft()
+            lanes.move_to_end(guild_id)
+
+            if not lane:
+                del lanes[guild_id]
+
+            waited = now - self.budget_waits.pop((priority, guild_id), now)
+
+            if self.metrics is not None:
+                self.metrics.increment("rate_limit_wait_seconds", waited)
+
+            return action
+
+        return None
+
+    async def next_action(self, high_only: bool):
+        async with self.condition:
+            while True:
+                if self.high_lane:
+                    return self.high_lane.popleft()
+
+                if not high_only and (self.low_lanes or self.bulk_lanes):
+                    for priority in (Priority.LOW, Priority.BULK):
+                        if (action := self.next_background_action(priority)) is not None:
+                            return action
+
+                    # Check again once the first guild has budget again
+                    waits = [self.budget(priority, guild_id).seconds_until_token()
+                             for priority in (Priority.LOW, Priority.BULK)
+                             for guild_id in self.lanes(priority)]
+
+                    if waits:
+                        self.wake_later(min(waits))
+
+                await self.condition.wait()
+
+    async def run_worker(self, high_only: bool):
+        while True:
+            guild_id, route, action, priority, future = await self.next_action(high_only)
+
+            # The caller may have given up on the action already
+            if future.cancelled():
+                continue
+
+            try:
+                result = await self.run_action(guild_id, route, action, priority)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    async def run_action(self, guild_id, route, action, priority=Priority.HIGH):
+        # Background actions have already taken their budget when they were
+        # dequeued
+        if self.metrics is not None:
+            self.metrics.increment("discord_api_calls")
+
+        # Bulk jobs only count against their own limit, so they neither wait
+        # behind nor hold up the guild's commands and verification
+        if priority == Priority.BULK:
+            bulk_limit = self.bulk_limits.setdefault(
+                guild_id, asyncio.Semaphore(self.bulk_concurrency))
+
+            async with bulk_limit:
+                return await action()
+
+        guild_limit = self.guild_limits.setdefault(
+            guild_id, asyncio.Semaphore(self.guild_concurrency))
+        route_limit = self.route_limits.setdefault(
+            (guild_id, route), asyncio.Semaphore(self.route_concurrency))
+
+        async with guild_limit, route_limit:
+            return await action()
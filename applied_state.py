@@ -0,0 +1,96 @@
+import collections
+import datetime
+import hashlib
+
+import discord
+
+# What verification last applied to a form respondent in a guild
+AppliedState = collections.namedtuple("AppliedState", ["member_id", "digest", "applied_at"])
+
+
+def outcome_digest(nickname: str, role_id: int):
+    """
+    Hashes the outcome of verifying a member (their nickname and verified
+    role), so that it can be compared with what was applied before.
+
+    `hash` isn't stable between runs, so the digest comes from hashlib.
+    """
+    return hashlib.blake2b(f"{nickname}\0{role_id}".encode(), digest_size=8).hexdigest()
+
+
+class AppliedStates:
+    """
+    Remembers what verification last applied to each form respondent in each
+    guild, so that respondents whose outcome hasn't changed since then can be
+    skipped.
+
+    States are keyed by guild id and full username, and also remember the
+    member they were applied to so that they can be forgotten when that
+    member leaves or is reverified.
+    """
+
+    def __init__(self, rows=()):
+        # Guild id -> username -> applied state
+        self.states = {}
+        # (Guild id, member id) -> username
+        self.usernames = {}
+
+        for guild_id, username, member_id, digest, applied_at in rows:
+            self.record(guild_id, username, member_id, digest, applied_at)
+
+    def get(self, guild_id: int, username: str):
+        return self.states.get(guild_id, {}).get(username)
+
+    def unchanged(self, guild_id: int, username: str, digest: str):
+        return (state := self.get(guild_id, username)) is not None and state.digest == digest
+
+    def record(self, guild_id: int, username: str, member_id: int, digest: str, now: float):
+        """
+        Records an applied outcome. Returns the row to store in the database.
+        """
+        guild_states = self.states.setdefault(guild_id, {})
+
+        # A username can move to another account, which replaces its state
+        if (previous := guild_states.get(username)) is not None:
+            self.usernames.pop((guild_id, previous.member_id), None)
+
+        guild_states[username] = AppliedState(member_id, digest, now)
+        self.usernames[(guild_id, member_id)] = username
+
+        return guild_id, username, member_id, digest, now
+
+    def forget(self, guild_id: int, member_id: int):
+        """
+        Forgets the state applied to a member. Returns whether there was one.
+        """
+        if (username := self.usernames.pop((guild_id, member_id), None)) is None:
+            return False
+
+        del self.states[guild_id][username]
+        return True
+
+    def prune(self, guild: discord.Guild):
+        """
+        Forgets the states of members who left the guild or rejoined it since
+        they were verified, which needs the guild's members to be cached.
+
+        Returns the ids of the forgotten members.
+        """
+        stale_ids = []
+
+        for state in self.states.get(guild.id, {}).values():
+            if (member := guild.get_member(state.member_id)) is None:
+                stale_ids.append(state.member_id)
+                continue
+
+            # discord.py gives join times as naive UTC datetimes
+            if member.joined_at is not None:
+                joined_at = member.joined_at.replace(tzinfo=datetime.timezone.utc)
+
+                if joined_at.timestamp() > state.applied_at:
+                    stale_ids.append(state.member_id)
+
+        for member_id in stale_ids:
+            self.forget(guild.id, member_id)
+
+        return stale_ids
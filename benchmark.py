@@ -0,0 +1,389 @@
+"""
+Benchmarks full verification cycles against fake guilds and a fake sheet.
+
+Usage: python benchmark.py [sizes...]
+
+Each size is used as both the number of guild members and the number of form
+responses (1000, 10000 and 100000 by default). For every size, four cycles
+are run: a cold full read where every member still has to be verified, an
+incremental poll that finds no new rows, a forced full re-read where every
+member is already verified, and a restart that resumes from the database.
+Wall time, peak traced memory and the number of Discord calls each cycle
+would have made are reported.
+
+After that, reverifying a role of up to 200 members is timed with the
+scheduler limits bulk jobs had before they got their own lane (the
+verification loop's budget, one edit at a time) and with the default bulk
+limits. Edits take a simulated 100 ms, and time is sped up by
+`REVERIFY_TIME_SCALE`, so the reported times are what the job would take
+against Discord.
+
+Nothing is sent to Discord or Google; discord.py and the other requirements
+still have to be installed.
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+GUILD_ID = 1
+VERIFIED_ROLE_ID = 2
+
+# Most members reverified by the reverify benchmark
+REVERIFY_MEMBERS = 200
+
+# How much faster than real time the reverify benchmark runs
+REVERIFY_TIME_SCALE = 100
+
+# Seconds a member edit takes against Discord, before scaling
+EDIT_LATENCY = 0.1
+
+
+def write_configs(directory: str):
+    """
+    Writes the configuration files the bot's modules read, so the benchmark
+    never touches real ones.
+    """
+    with open(os.path.join(directory, "sheetsconfig.yaml"), "w") as config:
+        config.write("spreadsheet_id: benchmark\n"
+                     "range_name: Form Responses 1!A2:C\n"
+                     "metrics_file: benchmark.prom\n")
+
+    with open(os.path.join(directory, "embedconfig.yaml"), "w") as config:
+        config.write("title: Benchmark\n"
+                     "description: Benchmark\n"
+                     "footer: Benchmark\n"
+                     "thumbnail_url: https://example.com/image.png\n")
+
+
+class CallCounter:
+    def __init__(self):
+        self.calls = 0
+        # Seconds each call takes
+        self.latency = 0.0
+
+
+class FakeMessage:
+    id = 0
+
+    async def edit(self, content=None, embed=None):
+        pass
+
+
+class FakeChannel:
+    """
+    Stands in for text and DM channels, which messages are "sent" to.
+    """
+
+    def __init__(self, channel_id=0):
+        self.id = channel_id
+
+    async def send(self, content=None, embed=None):
+        return FakeMessage()
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+
+class FakeMember:
+    """
+    Stands in for `discord.Member`, counting Discord calls instead of making
+    them.
+    """
+
+    def __init__(self, member_id: int, name: str, guild, roles, counter: CallCounter):
+        self.id = member_id
+        self.name = name
+        self.discriminator = "0001"
+        self.nick = None
+        self.joined_at = None
+        self.roles = roles
+        self.guild = guild
+        self.counter = counter
+        self.dm_channel = None
+
+    async def create_dm(self):
+        self.dm_channel = FakeChannel()
+
+    async def edit(self, nick=..., roles=..., reason=None):
+        self.counter.calls += 1
+
+        if self.counter.latency:
+            await asyncio.sleep(self.counter.latency)
+
+        if nick is not ...:
+            self.nick = nick
+
+        if roles is not ...:
+            self.roles = [self.guild.default_role] + roles
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, member_count: int, counter: CallCounter):
+        self.id = guild_id
+        self.default_role = FakeRole(guild_id, "@everyone")
+        self.verified_role = FakeRole(VERIFIED_ROLE_ID, "Verified")
+        self.roles = [self.default_role, self.verified_role]
+
+        self.me = FakeMember(0, "AuthBot", self, [self.default_role], counter)
+        self.members_by_id = {
+            member_id: FakeMember(member_id, f"user{member_id}", self,
+                                  [self.default_role], counter)
+            for member_id in range(1, member_count + 1)
+        }
+
+        # Member list pages and gateway member queries that were requested
+        self.member_pages = 0
+        self.member_queries = 0
+
+    @property
+    def members(self):
+        return list(self.members_by_id.values())
+
+    def get_member(self, member_id: int):
+        return self.members_by_id.get(member_id)
+
+    def get_role(self, role_id: int):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def query_members(self, query=None, *, limit=5, user_ids=None, presences=False,
+                            cache=True):
+        self.member_queries += 1
+
+        if user_ids is not None:
+            members = [self.members_by_id[member_id] for member_id in user_ids
+                       if member_id in self.members_by_id]
+        else:
+            members = [member for member in self.members_by_id.values()
+                       if member.name.lower().startswith(query.lower())]
+
+        return members[:limit]
+
+    async def fetch_members(self, limit=1000):
+        members = list(self.members_by_id.values())[:limit]
+
+        # Discord returns the member list 1000 members at a time
+        for idx in range(0, len(members), 1000):
+            self.member_pages += 1
+
+            for member in members[idx:idx + 1000]:
+                yield member
+
+
+class FakeBot:
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+
+    def get_guild(self, guild_id: int):
+        return self.guild if guild_id == self.guild.id else None
+
+
+def make_rows(count: int):
+    rows = []
+
+    for idx in range(1, count + 1):
+        # Every tenth response has a nickname that doesn't match the email
+        nickname = "Nick" if idx % 10 == 0 else "John Doe"
+        rows.append([nickname, f"user{idx}#0001", f"doej{idx}@school.org"])
+
+    return rows
+
+
+def make_fake_client(sheets, rows: list):
+    class FakeSheetsClient(sheets.SheetsClient):
+        """
+        Serves the generated rows for any requested range.
+        """
+
+        def batch_get(self, spreadsheet_id: str, ranges: list):
+            values = []
+
+            for range_name in ranges:
+                range_match = sheets.A1_RANGE_REGEX.match(range_name)
+                offset = int(range_match.group("start_row") or 2) - 2
+                values.append(rows[offset:])
+
+            return values
+
+    return FakeSheetsClient(credentials=object())
+
+
+async def run_cycle(cog, worker):
+    cog.poller.next_poll = 0.0
+    await cog.update_data()
+
+    if worker.task is not None:
+        await worker.task
+
+
+async def benchmark_size(size: int):
+    # The bot's modules read their configuration from the working directory,
+    # so they are only imported once it has been set up
+    import sheets
+    from action_scheduler import ActionScheduler
+    from dm_outbox import DMOutbox
+    from guild_worker import GuildWorker
+    from sheets_bridge import Verification
+    from storage import Storage
+
+    counter = CallCounter()
+    guild = FakeGuild(GUILD_ID, size, counter)
+    rows = make_rows(size)
+
+    storage = Storage(":memory:")
+    logger = logging.getLogger("benchmark")
+    await storage.set_verified_role(GUILD_ID, VERIFIED_ROLE_ID)
+    await storage.set_verifying(GUILD_ID, True)
+
+    def make_cog():
+        cog = Verification(FakeBot(guild), None, logger, storage,
+                           DMOutbox(storage, logger))
+
+        cog.sheets_client = make_fake_client(sheets, rows)
+
+        # Only measure the pipeline itself, not the background rate budget
+        cog.scheduler = ActionScheduler(background_rate=10 ** 9, metrics=cog.metrics)
+
+        return cog
+
+    cog = make_cog()
+    worker = GuildWorker(GUILD_ID, cog.verify_guild, logger,
+                         time_budget=float("inf"))
+    worker.start()
+    cog.workers[GUILD_ID] = worker
+
+    results = []
+
+    for label in ("cold full read", "incremental, no new rows", "warm full re-read",
+                  "restart"):
+        if label == "warm full re-read":
+            for cursor in cog.sheet_cursors.values():
+                cursor.reset()
+
+        counter.calls = 0
+
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+
+        if label == "restart":
+            cog.scheduler.close()
+            cog.sheets_client.close()
+
+            # A new cog picks up where the old one stopped from the database
+            cog = make_cog()
+            await cog.resume_verification()
+            worker = cog.workers[GUILD_ID]
+
+            if worker.task is not None:
+                await worker.task
+
+        await run_cycle(cog, worker)
+        elapsed = time.perf_counter() - start
+
+        peak = tracemalloc.get_traced_memory()[1]
+        results.append((label, elapsed, peak, counter.calls))
+
+    cog.scheduler.close()
+    cog.sheets_client.close()
+    storage.close()
+
+    return results
+
+
+async def benchmark_reverify(size: int):
+    """
+    Times reverifying the verified role with the limits bulk jobs had before
+    they got their own lane, and with the current defaults.
+    """
+    import sheets
+    from action_scheduler import ActionScheduler
+    from dm_outbox import DMOutbox
+    from reverify_job import ReverifyJob
+    from sheets_bridge import Verification
+    from storage import Storage
+
+    member_count = min(size, REVERIFY_MEMBERS)
+    logger = logging.getLogger("benchmark")
+    results = []
+
+    defaults = ActionScheduler()
+    lane_limits = [
+        ("reverify, before", {"bulk_rate": defaults.background_rate,
+                              "bulk_per": defaults.background_per,
+                              "bulk_concurrency": defaults.route_concurrency}),
+        ("reverify, bulk lane", {"bulk_rate": defaults.bulk_rate,
+                                 "bulk_per": defaults.bulk_per,
+                                 "bulk_concurrency": defaults.bulk_concurrency})
+    ]
+
+    for label, limits in lane_limits:
+        counter = CallCounter()
+        counter.latency = EDIT_LATENCY / REVERIFY_TIME_SCALE
+        guild = FakeGuild(GUILD_ID, member_count, counter)
+
+        for member in guild.members:
+            member.roles = [guild.default_role, guild.verified_role]
+
+        storage = Storage(":memory:")
+        await storage.set_verified_role(GUILD_ID, VERIFIED_ROLE_ID)
+
+        cog = Verification(FakeBot(guild), None, logger, storage,
+                           DMOutbox(storage, logger))
+        limits = dict(limits, bulk_per=limits["bulk_per"] / REVERIFY_TIME_SCALE)
+        cog.scheduler = ActionScheduler(metrics=cog.metrics, **limits)
+
+        job = ReverifyJob(guild, guild.verified_role, FakeChannel(),
+                          list(guild.members_by_id), storage, cog.reverify_role_member,
+                          cog.member_index.get_member, logger)
+
+        start = time.perf_counter()
+        await job.start()
+        elapsed = (time.perf_counter() - start) * REVERIFY_TIME_SCALE
+
+        cog.scheduler.close()
+        cog.dm_outbox.close()
+        storage.close()
+
+        results.append((member_count, label, elapsed, counter.calls))
+
+    return results
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_configs(directory)
+        os.chdir(directory)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+        tracemalloc.start()
+
+        print(f"{'size':>8}  {'cycle':<26} {'wall (s)':>10} {'peak (MiB)':>11} {'calls':>8}")
+
+        for size in sizes:
+            for label, elapsed, peak, calls in asyncio.run(benchmark_size(size)):
+                print(f"{size:>8}  {label:<26} {elapsed:>10.3f} "
+                      f"{peak / 2 ** 20:>11.1f} {calls:>8}")
+
+        tracemalloc.stop()
+
+        print()
+        print(f"{'members':>8}  {'job':<26} {'time (s)':>10} {'edits':>8}")
+
+        for member_count, label, elapsed, calls in asyncio.run(benchmark_reverify(max(sizes))):
+            print(f"{member_count:>8}  {label:<26} {elapsed:>10.1f} {calls:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
+import time
+
+# When the bot was started, for the startup timing report
+STARTUP_TIME = time.perf_counter()
+
+import asyncio
 import discord
 from discord.ext import commands, tasks
 import logging
+import os
 import yaml
 
 import utilities
@@ -8,8 +15,10 @@ import sheets
 import sheets_bridge
 import modrole
 import quarantine_count
+import storage
+from dm_outbox import DMOutbox
 
-sheetsCreds = None
+dm_outbox = None
 
 
 def setup_logging():
@@ -27,6 +36,33 @@ def setup_logging():
 logger: logging.Logger = setup_logging()
 
 
+class StartupTimer:
+    """
+    Measures how long each step of starting the bot takes.
+    """
+
+    def __init__(self, start: float):
+        self.last = start
+        self.steps = []
+
+    def mark(self, step: str):
+        """
+        Records that a step (which started when the last one ended) finished.
+        """
+        now = time.perf_counter()
+        self.steps.append((step, now - self.last))
+        self.last = now
+
+    def report(self):
+        total = sum(seconds for step, seconds in self.steps)
+        steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in self.steps)
+
+        return f"{steps} (total {total:.2f}s)"
+
+
+startup_timer = StartupTimer(STARTUP_TIME)
+
+
 def get_token():
     with open("discordtoken.yaml", "r") as botToken:
         try:
@@ -36,6 +72,69 @@ def get_token():
             print(f"Error reading discordtoken.yaml: {e}")
 
 
+def get_bot_config():
+    """
+    Reads the optional botconfig.yaml (or the file named by the AUTHBOT_CONFIG
+    environment variable), returning an empty config if it doesn't exist.
+    """
+    config_file = os.environ.get("AUTHBOT_CONFIG", "botconfig.yaml")
+
+    try:
+        with open(config_file, "r") as bot_config:
+            return yaml.safe_load(bot_config) or {}
+    except FileNotFoundError:
+        return {}
+    except yaml.YAMLError as e:
+        print(f"Error reading {config_file}: {e}")
+        return {}
+
+
+def client_options(light_member_cache: bool):
+    """
+    Returns the member caching options for the bot.
+
+    With the light member cache, guild members are neither chunked at startup
+    nor cached, and the verification cog looks up form respondents on demand
+    instead.
+    """
+    # Needed for member join events and member lookups
+    intents = discord.Intents.default()
+    intents.members = True
+
+    if not light_member_cache:
+        return {"intents": intents}
+
+    return {"intents": intents,
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "chunk_guilds_at_startup": False}
+
+
+def shard_options(bot_config: dict):
+    """
+    Returns the sharding options for the bot, which are empty unless
+    `shard_count` is configured.
+
+    Each process runs the shards in `shard_ids` (or all of them if it isn't
+    set), so the shards can be split across several processes.
+    """
+    if "shard_count" not in bot_config:
+        return {}
+
+    return {"shard_count": bot_config["shard_count"],
+            "shard_ids": bot_config.get("shard_ids")}
+
+
+def shard_name(bot_config: dict):
+    """
+    Names the shards this process runs (e.g. `0-1`), or returns None if it
+    runs all of them.
+    """
+    if (shard_ids := bot_config.get("shard_ids")) is None:
+        return None
+
+    return "-".join(str(shard_id) for shard_id in shard_ids)
+
+
 class EmbedHelpCommand(commands.HelpCommand):
     """
     An implementation of HelpCommand that uses an embed to make the help menu
@@ -126,26 +225,37 @@ help_command_with_usage = EmbedHelpCommand(command_attrs={
 # Variable for keeping track of restarts
 restart_count = 0
 
-# Bot code
-client = commands.Bot("!", help_command=help_command_with_usage)
+# Created by `create_client` once the bot config has been read
+client: commands.Bot = None
+
 
-@client.event
 async def on_ready():
     global restart_count
     restart_count += 1
     logger.info("%s is up and running (restarts: %s)", client.user.name, restart_count)
     client.add_cog(quarantine_count.QuarantineCount(client))
 
+    # The Sheets API is only set up once the bot is connected to Discord
+    if restart_count == 1:
+        startup_timer.mark("connecting to Discord")
+        asyncio.ensure_future(start_sheets())
+
 
-@client.event
 async def on_member_join(member):
-    if member.dm_channel is None:
-        await member.create_dm()
+    # Members who already filled out the form are verified right away by the
+    # verification cog, so they don't need the information embed. Respondents
+    # who can't be verified (e.g. without a valid school email) still get it.
+    verification = client.get_cog("Verification")
 
-    await member.dm_channel.send(embed=utilities.info_embed)
+    if (verification is not None and verification.is_verifying(member.guild.id) and
+            verification.join_changes(member)):
+        return
 
+    # The DM is sent in the background
+    dm_outbox.enqueue(member)
 
-@client.command(usage="info")
+
+@commands.command(usage="info")
 async def info(ctx: commands.Context):
     """
     Sends an information embed.
@@ -155,7 +265,6 @@ async def info(ctx: commands.Context):
     await ctx.send(embed=utilities.info_embed)
 
 
-@client.check
 def guild_only(ctx: commands.Context):
     return ctx.guild is not None
 
@@ -166,7 +275,25 @@ def setup_sheets_api():
     return sheetsCreds
 
 
-@client.event
+async def start_sheets():
+    """
+    Connects to the Google Sheets API in the background and hands the
+    credentials to the verification cog.
+    """
+    loop = asyncio.get_running_loop()
+
+    try:
+        sheetsCreds = await loop.run_in_executor(None, setup_sheets_api)
+    except Exception:
+        logger.exception("Failed to connect to the Google Sheets API")
+        return
+
+    client.get_cog("Verification").start_sheets(sheetsCreds)
+
+    startup_timer.mark("connecting to the Sheets API")
+    logger.info("Startup timing: %s", startup_timer.report())
+
+
 async def on_command_error(ctx: commands.Context, error: commands.CommandError):
     if isinstance(error, commands.CheckFailure):
         logger.error("%s tried and failed to executed command %s: %s",
@@ -176,13 +303,50 @@ async def on_command_error(ctx: commands.Context, error: commands.CommandError):
                      ctx.command.qualified_name, error)
 
 
+def create_client(bot_config: dict, light_member_cache: bool):
+    """
+    Creates the bot and registers the events, commands and checks above.
+    """
+    # Sharded processes share the database, and fetched sheets through it
+    bot_class = commands.AutoShardedBot if "shard_count" in bot_config else commands.Bot
+
+    new_client = bot_class("!", help_command=help_command_with_usage,
+                           **client_options(light_member_cache), **shard_options(bot_config))
+
+    for event in (on_ready, on_member_join, on_command_error):
+        new_client.event(event)
+
+    new_client.add_command(info)
+    new_client.add_check(guild_only)
+
+    return new_client
+
+
 if __name__ == "__main__":
-    sheetsCreds = setup_sheets_api()
+    startup_timer.mark("imports")
+
+    bot_config = get_bot_config()
+
+    # Whether guild members are cached (`member_cache: full`, the default) or
+    # looked up on demand (`member_cache: light`)
+    light_member_cache = bot_config.get("member_cache", "full") == "light"
+    sharded = "shard_count" in bot_config
 
     # Discord bot setup
-    # logger: logging.Logger = setup_logging()
-    client.add_cog(sheets_bridge.Verification(client, sheetsCreds, logger))
-    client.add_cog(modrole.Modrole(client))
+    client = create_client(bot_config, light_member_cache)
+
+    # Guild data and modroles are shared through one database
+    bot_storage = storage.Storage(bot_config.get("database_file", storage.DATABASE_FILE))
+    dm_outbox = DMOutbox(bot_storage, logger)
+
+    # The Sheets API credentials are loaded after connecting (see `on_ready`)
+    client.add_cog(sheets_bridge.Verification(
+        client, None, logger, bot_storage, dm_outbox,
+        light_member_cache=light_member_cache, shared_fetch=sharded,
+        scheduler_options=bot_config.get("scheduler"), shard_name=shard_name(bot_config)))
+    client.add_cog(modrole.Modrole(client, bot_storage))
+
+    startup_timer.mark("loading guild data")
 
     token = get_token()["token"]
     client.run(token)
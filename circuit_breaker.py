@@ -0,0 +1,134 @@
+import enum
+import logging
+import random
+import time
+
+# Fetch attempts per cycle while a spreadsheet is healthy, and the delays
+# (in seconds) that retries are drawn from
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 30
+
+# Failed cycles in a row before a spreadsheet stops being fetched
+FAILURE_THRESHOLD = 3
+
+# Seconds until the first probe of a failing spreadsheet, doubled (up to the
+# maximum) every time a probe fails
+OPEN_SECONDS = 60
+MAX_OPEN_SECONDS = 900
+
+
+def is_transient(error: Exception):
+    """
+    Checks whether a Sheets API error is likely to go away by itself (rate
+    limits, server errors and network trouble), unlike e.g. missing access to
+    the spreadsheet or credentials that can't be refreshed.
+    """
+    from googleapiclient.errors import HttpError
+    from google.auth.exceptions import RefreshError
+
+    if isinstance(error, HttpError):
+        return error.resp.status == 429 or error.resp.status >= 500
+
+    if isinstance(error, RefreshError):
+        return False
+
+    # Timeouts, dropped connections and anything unexpected
+    return True
+
+
+def is_bad_request(error: Exception):
+    """
+    Checks whether a Sheets API error means the request itself was invalid,
+    e.g. because one of its ranges doesn't exist.
+    """
+    from googleapiclient.errors import HttpError
+
+    return isinstance(error, HttpError) and error.resp.status == 400
+
+
+def backoff_delay(attempt: int):
+    """
+    Returns how long to wait before retry number `attempt` (counting from 0),
+    using exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class BreakerState(enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Stops fetching a spreadsheet that keeps failing, so that guilds keep their
+    last good snapshot instead of hammering the API during outages.
+
+    The breaker opens after `FAILURE_THRESHOLD` failed cycles in a row (or
+    right away for errors that won't go away by themselves). Once it has been
+    open for a while, it lets a single probe through (half-open), which
+    either closes it again or keeps it open for twice as long.
+    """
+
+    def __init__(self, name: str, logger: logging.Logger):
+        self.name = name
+        self.logger = logger
+
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.last_error = None
+
+        self.open_seconds = OPEN_SECONDS
+        self.probe_at = 0.0
+
+    def allow(self):
+        """
+        Checks whether the spreadsheet may be fetched right now.
+        """
+        if self.state is BreakerState.OPEN and time.monotonic() >= self.probe_at:
+            self.state = BreakerState.HALF_OPEN
+            self.logger.info("Probing spreadsheet %s", self.name)
+
+        return self.state is not BreakerState.OPEN
+
+    def record_success(self):
+        if self.state is not BreakerState.CLOSED:
+            self.logger.info("Spreadsheet %s recovered after %s failures",
+                             self.name, self.failures)
+
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.open_seconds = OPEN_SECONDS
+
+    def record_failure(self, error: Exception):
+        """
+        Records a failed fetch. Returns whether the breaker opened because of
+        it.
+        """
+        self.failures += 1
+        self.last_error = error
+
+        if self.state is BreakerState.HALF_OPEN:
+            self.open_seconds = min(self.open_seconds * 2, MAX_OPEN_SECONDS)
+        elif self.failures < FAILURE_THRESHOLD and is_transient(error):
+            return False
+
+        self.state = BreakerState.OPEN
+        self.probe_at = time.monotonic() + self.open_seconds
+        self.logger.warning("Not fetching spreadsheet %s for %s seconds after %s failures: %s",
+                            self.name, self.open_seconds, self.failures, error)
+
+        return True
+
+    def status_text(self):
+        text = self.state.value
+
+        if self.state is BreakerState.OPEN:
+            text += f", probing in {max(self.probe_at - time.monotonic(), 0):.0f}s"
+
+        if self.failures:
+            text += f" ({self.failures} failures, last: {self.last_error})"
+
+        return text
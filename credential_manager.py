@@ -0,0 +1,85 @@
+import asyncio
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import sheets
+
+# Seconds before they expire that credentials are refreshed. This is more than
+# google-auth's own refresh threshold, so requests never have to refresh them.
+REFRESH_MARGIN = 300
+
+# Longest time (in seconds) between checks of the credentials' expiry
+CHECK_INTERVAL = 3600
+
+# Seconds to wait before retrying a failed refresh
+RETRY_DELAY = 30
+
+
+class CredentialManager:
+    """
+    Refreshes Google credentials in the background shortly before they expire.
+
+    Refreshing blocks, so it runs on its own worker thread instead of the
+    event loop or the thread Sheets requests run on. Refreshed credentials
+    are saved to the token file right away (see `sheets.save_credentials`).
+    """
+
+    def __init__(self, credentials, logger: logging.Logger,
+                 token_file=sheets.TOKEN_FILE):
+        self.credentials = credentials
+        self.logger = logger
+        self.token_file = token_file
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="credentials")
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+
+        self.executor.shutdown(wait=False)
+
+    def seconds_until_refresh(self):
+        # Credentials without an expiry never have to be refreshed
+        if self.credentials.expiry is None:
+            return CHECK_INTERVAL
+
+        # google-auth keeps expiry times as naive UTC datetimes
+        remaining = self.credentials.expiry - datetime.datetime.utcnow()
+
+        return min(max(remaining.total_seconds() - REFRESH_MARGIN, 0), CHECK_INTERVAL)
+
+    def refresh(self):
+        from google.auth.transport.requests import Request
+
+        self.credentials.refresh(Request())
+        sheets.save_credentials(self.credentials, self.token_file)
+
+    async def run(self):
+        if not self.credentials.refresh_token:
+            self.logger.warning("Google credentials have no refresh token, "
+                                "so they can't be refreshed in the background")
+            return
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await asyncio.sleep(self.seconds_until_refresh())
+
+            if self.seconds_until_refresh() > 0:
+                continue
+
+            try:
+                await loop.run_in_executor(self.executor, self.refresh)
+            except Exception as e:
+                self.logger.error("Failed to refresh Google credentials: %s", e)
+                await asyncio.sleep(RETRY_DELAY)
+            else:
+                self.logger.info("Refreshed Google credentials (valid until %s UTC)",
+                                 self.credentials.expiry)
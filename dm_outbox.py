@@ -0,0 +1,120 @@
+import asyncio
+import collections
+import logging
+import time
+
+import discord
+
+from storage import Storage
+import utilities
+
+# Number of DMs sent at the same time
+WORKERS = 2
+
+# Seconds during which repeated DMs to the same user are dropped
+DEDUPE_SECONDS = 600
+
+# Attempts per DM, and the delay before the first retry (doubled every time)
+MAX_ATTEMPTS = 4
+RETRY_DELAY = 5
+
+
+class DMOutbox:
+    """
+    Sends the information embed to users in the background.
+
+    Handlers only enqueue users and return right away. Users are DMed at most
+    once every `DEDUPE_SECONDS`, so bursts (e.g. join raids or mass reverifies)
+    collapse into a single DM per user. Failed DMs are retried with
+    exponential backoff, except for users that don't accept DMs from the bot
+    (`discord.Forbidden`), who are remembered and never DMed again.
+    """
+
+    def __init__(self, storage: Storage, logger: logging.Logger):
+        self.storage = storage
+        self.logger = logger
+
+        self.queue = None
+        self.workers = []
+
+        # User id -> when they were last enqueued, oldest first
+        self.recently_queued = collections.OrderedDict()
+        self.blocked_ids = storage.load_dm_blocked()
+
+    def enqueue(self, user: discord.abc.User):
+        """
+        Queues the information embed to be DMed to a user.
+
+        Returns whether the DM was queued, which it isn't if the user was
+        queued recently or doesn't accept DMs.
+        """
+        if user.id in self.blocked_ids:
+            return False
+
+        now = time.monotonic()
+        self.forget_old_users(now)
+
+        if user.id in self.recently_queued:
+            return False
+
+        self.recently_queued[user.id] = now
+
+        self.ensure_started()
+        self.queue.put_nowait((user, 0))
+
+        return True
+
+    def forget_old_users(self, now: float):
+        # Users are kept in the order they were queued, so only the expired
+        # ones at the front have to be looked at
+        while self.recently_queued:
+            user_id, queued_at = next(iter(self.recently_queued.items()))
+
+            if now - queued_at < DEDUPE_SECONDS:
+                break
+
+            self.recently_queued.popitem(last=False)
+
+    def ensure_started(self):
+        if self.workers:
+            return
+
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.ensure_future(self.run_worker())
+                        for _ in range(WORKERS)]
+
+    def close(self):
+        for worker in self.workers:
+            worker.cancel()
+
+        self.workers = []
+
+    async def run_worker(self):
+        while True:
+            user, attempt = await self.queue.get()
+
+            try:
+                await self.send(user)
+            except discord.Forbidden:
+                self.logger.error(f"Cannot DM {user.name}; not trying again")
+                self.blocked_ids.add(user.id)
+                await self.storage.add_dm_blocked(user.id)
+            except discord.HTTPException as e:
+                if attempt + 1 < MAX_ATTEMPTS:
+                    # Requeue the DM later without holding up this worker
+                    asyncio.get_event_loop().call_later(
+                        RETRY_DELAY * 2 ** attempt, self.queue.put_nowait, (user, attempt + 1))
+                else:
+                    self.logger.error(f"Failed to DM {user.name}: {e}")
+            except Exception:
+                # Anything else (e.g. a broken embed config) only drops this
+                # DM, so the worker keeps sending the others
+                self.logger.exception(f"Failed to DM {user.name}")
+            finally:
+                self.queue.task_done()
+
+    async def send(self, user: discord.abc.User):
+        if user.dm_channel is None:
+            await user.create_dm()
+
+        await user.dm_channel.send(embed=utilities.info_embed)
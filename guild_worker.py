@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+
+# Longest time (in seconds) a worker spends scheduling edits in one pass
+TIME_BUDGET = 60
+
+
+class GuildConfigError(Exception):
+    """ Error type for when a guild can't be verified with its current settings. """
+    pass
+
+
+class GuildWorker:
+    """
+    Verifies the members of a single guild.
+
+    The verification loop hands each worker the usernames from every sheet
+    poll, and the worker processes them on its own task. Workers are started
+    and stopped independently, so a slow or misconfigured guild never holds up
+    or stops verification in the others.
+
+    `verify` is a coroutine function taking the guild id, a set of usernames
+    and a deadline (in `time.monotonic` time). It returns the usernames it
+    didn't get to before the deadline, which are carried over to the next
+    pass. Passes run back to back until nothing is left.
+    """
+
+    def __init__(self, guild_id: int, verify, logger: logging.Logger,
+                 time_budget=TIME_BUDGET):
+        self.guild_id = guild_id
+        self.verify = verify
+        self.logger = logger
+        self.time_budget = time_budget
+
+        self.running = False
+        self.pending = set()
+        self.task = None
+        self.last_error = None
+
+    def start(self):
+        self.running = True
+        self.last_error = None
+
+    def stop(self):
+        self.running = False
+        self.pending.clear()
+        self.cancel()
+
+    def cancel(self):
+        """
+        Cancels the current pass, if any. Its usernames stay pending.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def submit(self, usernames):
+        """
+        Queues usernames to be verified and wakes the worker if it is idle.
+
+        Submitting no usernames still resumes work left over from a previous
+        pass.
+        """
+        if not self.running:
+            return
+
+        self.pending.update(usernames)
+
+        if self.pending and (self.task is None or self.task.done()):
+            self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        while self.running and self.pending:
+            usernames, self.pending = self.pending, set()
+            deadline = time.monotonic() + self.time_budget
+
+            try:
+                leftover = await self.verify(self.guild_id, usernames, deadline)
+            except asyncio.CancelledError:
+                self.pending |= usernames
+                raise
+            except GuildConfigError as e:
+                self.logger.error("Stopping verification in guild %s: %s",
+                                  self.guild_id, e)
+                self.last_error = e
+                self.running = False
+                self.pending.clear()
+                return
+            except Exception as e:
+                self.logger.exception("Verification failed in guild %s",
+                                      self.guild_id)
+                self.last_error = e
+                self.pending |= usernames
+                return
+
+            if leftover:
+                self.logger.info("Guild %s ran over its time budget, carrying %s members over",
+                                 self.guild_id, len(leftover))
+                self.pending |= leftover
+
+                # The rest is worked through in the next pass straight away,
+                # rather than after the next poll (which can be minutes away
+                # when the sheet is quiet). Passes are paced by the guild's
+                # rate budget, so this only gives other tasks a turn first.
+                await asyncio.sleep(0)
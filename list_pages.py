@@ -0,0 +1,98 @@
+import discord
+
+# Most characters in one page of a list, below the embed description limit
+PAGE_CHARACTERS = 2000
+
+# Most lines in one page of a list
+PAGE_LINES = 25
+
+
+def paginate(lines):
+    """
+    Splits lines into pages that each fit into an embed description.
+    """
+    pages = []
+    page_lines = []
+    page_length = 0
+
+    for line in lines:
+        # Lines longer than a whole page (which shouldn't happen) are cut off
+        line = line[:PAGE_CHARACTERS]
+
+        if page_lines and (len(page_lines) == PAGE_LINES or
+                           page_length + len(line) + 1 > PAGE_CHARACTERS):
+            pages.append("\n".join(page_lines))
+            page_lines = []
+            page_length = 0
+
+        page_lines.append(line)
+        page_length += len(line) + 1
+
+    if page_lines:
+        pages.append("\n".join(page_lines))
+
+    return pages
+
+
+def user_mention(user_id: int):
+    # Mentions render from the id alone, even for users that left the guild
+    return f"<@{user_id}>"
+
+
+def role_mention(role_id: int):
+    return f"<@&{role_id}>"
+
+
+class ListPages:
+    """
+    Caches the rendered pages of list commands (e.g. `ignore list`), so that
+    they are only rendered again after the listed items change.
+
+    Pages are cached per list name and guild. Whatever changes a list has to
+    call `invalidate` for it.
+    """
+
+    def __init__(self):
+        # (list name, guild id) -> pages
+        self.pages = {}
+
+    def get(self, name: str, guild_id: int, render):
+        """
+        Returns the pages of a list, calling `render` for its lines if they
+        aren't cached.
+        """
+        if (pages := self.pages.get((name, guild_id))) is None:
+            pages = paginate(render())
+            self.pages[(name, guild_id)] = pages
+
+        return pages
+
+    def invalidate(self, name: str, guild_id: int):
+        self.pages.pop((name, guild_id), None)
+
+    def clear(self, guild_id: int):
+        """
+        Drops every cached list of a guild.
+        """
+        for key in [key for key in self.pages if key[1] == guild_id]:
+            del self.pages[key]
+
+
+def page_embed(title: str, color: discord.Color, pages, page: int, empty_message: str):
+    """
+    Makes an embed showing one page (counting from 1) of a list. Pages out of
+    range show the closest page instead.
+    """
+    list_embed = discord.Embed(title=title, color=color)
+
+    if not pages:
+        list_embed.description = empty_message
+        return list_embed
+
+    page = min(max(page, 1), len(pages))
+    list_embed.description = pages[page - 1]
+
+    if len(pages) > 1:
+        list_embed.set_footer(text=f"Page {page} of {len(pages)}")
+
+    return list_embed
@@ -0,0 +1,114 @@
+import discord
+
+
+def full_username(user: discord.abc.User):
+    return user.name + "#" + user.discriminator
+
+
+class MemberIndex:
+    """
+    Maps the full usernames (name#discriminator) of guild members to their ids.
+
+    A guild's index is built once from its member list and then kept up to date
+    through member events, so lookups don't require walking `guild.members`.
+    """
+
+    def __init__(self):
+        # Guild id -> full username -> member id
+        self.ids_by_username = {}
+        # Guild id -> member id -> full username, for handling renames
+        self.usernames_by_id = {}
+
+    def ensure_built(self, guild: discord.Guild):
+        if guild.id in self.ids_by_username:
+            return
+
+        self.ids_by_username[guild.id] = {}
+        self.usernames_by_id[guild.id] = {}
+
+        for member in guild.members:
+            self.add(member)
+
+    def clear(self, guild_id: int = None):
+        """
+        Drops the index of a guild (or every guild), which will be rebuilt on
+        the next lookup.
+        """
+        if guild_id is None:
+            self.ids_by_username.clear()
+            self.usernames_by_id.clear()
+        else:
+            self.ids_by_username.pop(guild_id, None)
+            self.usernames_by_id.pop(guild_id, None)
+
+    def add(self, member: discord.Member):
+        # Indexes are only maintained once they've been built
+        if (guild_ids := self.ids_by_username.get(member.guild.id)) is None:
+            return
+
+        # The bot itself is never verified
+        if member == member.guild.me:
+            return
+
+        username = full_username(member)
+        guild_ids[username] = member.id
+        self.usernames_by_id[member.guild.id][member.id] = username
+
+    def remove(self, member: discord.Member):
+        if (guild_usernames := self.usernames_by_id.get(member.guild.id)) is None:
+            return
+
+        if (username := guild_usernames.pop(member.id, None)) is not None:
+            self.forget_username(member.guild.id, username, member.id)
+
+    def rename(self, user: discord.abc.User):
+        """
+        Updates the username of a user in every guild they are indexed in.
+        """
+        new_username = full_username(user)
+
+        for guild_id, guild_usernames in self.usernames_by_id.items():
+            if (old_username := guild_usernames.get(user.id)) is None:
+                continue
+
+            if old_username != new_username:
+                self.forget_username(guild_id, old_username, user.id)
+                self.ids_by_username[guild_id][new_username] = user.id
+                guild_usernames[user.id] = new_username
+
+    def forget_username(self, guild_id: int, username: str, member_id: int):
+        # The username may already belong to someone else, whose entry stays
+        guild_ids = self.ids_by_username[guild_id]
+
+        if guild_ids.get(username) == member_id:
+            del guild_ids[username]
+
+    def get(self, guild: discord.Guild, username: str):
+        """
+        Returns the member of a guild with the given full username, if any.
+        """
+        self.ensure_built(guild)
+
+        if (member_id := self.ids_by_username[guild.id].get(username)) is None:
+            return None
+
+        return guild.get_member(member_id)
+
+    async def resolve(self, guild: discord.Guild, usernames):
+        """
+        Returns the members of a guild with the given full usernames, as a dict
+        from username to member. Usernames not in the guild are left out.
+        """
+        resolved = {}
+
+        for username in usernames:
+            if (member := self.get(guild, username)) is not None:
+                resolved[username] = member
+
+        return resolved
+
+    async def get_member(self, guild: discord.Guild, member_id: int):
+        return guild.get_member(member_id)
+
+    async def role_members(self, guild: discord.Guild, role: discord.Role):
+        return role.members
@@ -0,0 +1,289 @@
+import asyncio
+import time
+
+import discord
+
+from member_index import full_username
+
+# Seconds a looked up member is reused before being fetched again
+MEMBER_TTL = 600
+
+# Number of member queries sent at the same time
+QUERY_CONCURRENCY = 4
+
+# Most members Discord returns for a single query
+QUERY_LIMIT = 100
+
+# Seconds between downloads of a guild's member list, which maps every
+# username in the guild to its member id
+ID_MAP_TTL = 3600
+
+
+class MemberResolver:
+    """
+    Looks up guild members on demand, for running without the member cache.
+
+    Usernames are mapped to member ids by paging through the guild's member
+    list over HTTP (1000 members per request) once every `ID_MAP_TTL`
+    seconds, and kept up to date by member events in between. Members are
+    then fetched by id with gateway queries of `QUERY_LIMIT` ids each.
+    Gateway queries share a budget of roughly 110 per minute per shard with
+    everything else the bot sends over the gateway, so querying every name on
+    its own would take minutes for a large sheet. Only the names that can't
+    be mapped because the member list couldn't be downloaded are queried one
+    at a time.
+
+    Looked up members are reused for `MEMBER_TTL` seconds, and only the
+    members that were asked for are kept, so memory scales with the number of
+    form respondents (plus a username and id per guild member) rather than
+    the size of the guild.
+
+    This has the same interface as `MemberIndex`.
+    """
+
+    def __init__(self, ttl=MEMBER_TTL, id_map_ttl=ID_MAP_TTL):
+        self.ttl = ttl
+        self.id_map_ttl = id_map_ttl
+
+        # Guild id -> full username -> member id
+        self.ids_by_username = {}
+        # Guild id -> member id -> full username, for handling renames
+        self.usernames_by_id = {}
+        # Guild id -> member id -> (member, expiry)
+        self.members = {}
+        # Guild id -> full username -> expiry, for usernames not in the guild
+        self.missing = {}
+        # Guild id -> when expired members were last dropped
+        self.last_pruned = {}
+        # Guild id -> when its member list was last downloaded
+        self.filled_at = {}
+        # Guild id -> lock held while its member list is downloaded
+        self.fill_locks = {}
+
+        self.query_semaphore = asyncio.Semaphore(QUERY_CONCURRENCY)
+
+    def clear(self, guild_id: int = None):
+        """
+        Drops everything known about a guild. Without a guild, only the looked
+        up members are dropped, since ids never change and usernames rarely
+        do (renames are noticed when members are refreshed by id).
+        """
+        if guild_id is None:
+            self.members.clear()
+            self.missing.clear()
+            return
+
+        for cache in (self.ids_by_username, self.usernames_by_id,
+                      self.members, self.missing, self.filled_at):
+            cache.pop(guild_id, None)
+
+    def add(self, member: discord.Member, now: float = None):
+        # The bot itself is never verified
+        if member == member.guild.me:
+            return
+
+        now = time.monotonic() if now is None else now
+        guild_id = member.guild.id
+        username = full_username(member)
+
+        guild_usernames = self.usernames_by_id.setdefault(guild_id, {})
+        guild_ids = self.ids_by_username.setdefault(guild_id, {})
+
+        if (old_username := guild_usernames.get(member.id)) not in (None, username):
+            guild_ids.pop(old_username, None)
+
+        guild_usernames[member.id] = username
+        guild_ids[username] = member.id
+        self.members.setdefault(guild_id, {})[member.id] = (member, now + self.ttl)
+        self.missing.get(guild_id, {}).pop(username, None)
+
+    def remove(self, member: discord.Member):
+        self.forget(member.guild.id, member.id)
+
+    def forget(self, guild_id: int, member_id: int):
+        self.members.get(guild_id, {}).pop(member_id, None)
+
+        if (username := self.usernames_by_id.get(guild_id, {}).pop(member_id, None)) is not None:
+            self.forget_username(guild_id, username, member_id)
+
+    def rename(self, user: discord.abc.User):
+        """
+        Updates the username of a user in every guild they are known in.
+        """
+        new_username = full_username(user)
+
+        for guild_id, guild_usernames in self.usernames_by_id.items():
+            if (old_username := guild_usernames.get(user.id)) is None:
+                continue
+
+            if old_username != new_username:
+                self.forget_username(guild_id, old_username, user.id)
+                self.ids_by_username[guild_id][new_username] = user.id
+                guild_usernames[user.id] = new_username
+
+    def forget_username(self, guild_id: int, username: str, member_id: int):
+        # The username may already belong to someone else, whose entry stays
+        guild_ids = self.ids_by_username[guild_id]
+
+        if guild_ids.get(username) == member_id:
+            del guild_ids[username]
+
+    def prune(self, guild_id: int, now: float):
+        # Only prune once in a while, since this walks every entry
+        if now - self.last_pruned.get(guild_id, 0.0) < self.ttl:
+            return
+
+        self.last_pruned[guild_id] = now
+
+        if (guild_members := self.members.get(guild_id)) is not None:
+            self.members[guild_id] = {member_id: entry for member_id, entry in guild_members.items()
+                                      if entry[1] > now}
+
+        if (guild_missing := self.missing.get(guild_id)) is not None:
+            self.missing[guild_id] = {username: expiry for username, expiry in guild_missing.items()
+                                      if expiry > now}
+
+    async def fill_ids(self, guild: discord.Guild, wanted, now: float):
+        """
+        Maps the username of every member of a guild to their id from its
+        member list. The members in `wanted` (a set of full usernames) are
+        kept as well, which saves looking them up again right after.
+        """
+        async with self.fill_locks.setdefault(guild.id, asyncio.Lock()):
+            # Someone else may have downloaded the list while this waited
+            if now - self.filled_at.get(guild.id, -self.id_map_ttl) < self.id_map_ttl:
+                return
+
+            guild_ids = {}
+            guild_usernames = {}
+            wanted_members = []
+
+            async for member in guild.fetch_members(limit=None):
+                # The bot itself is never verified
+                if member == guild.me:
+                    continue
+
+                username = full_username(member)
+                guild_ids[username] = member.id
+                guild_usernames[member.id] = username
+
+                if username in wanted:
+                    wanted_members.append(member)
+
+            self.ids_by_username[guild.id] = guild_ids
+            self.usernames_by_id[guild.id] = guild_usernames
+            self.missing.pop(guild.id, None)
+            self.filled_at[guild.id] = now
+
+            for member in wanted_members:
+                self.add(member, now)
+
+    async def query(self, guild: discord.Guild, **kwargs):
+        """
+        Sends a single member query, returning None if it timed out.
+        """
+        async with self.query_semaphore:
+            try:
+                return await guild.query_members(limit=QUERY_LIMIT, cache=False, **kwargs)
+            except asyncio.TimeoutError:
+                return None
+
+    async def resolve(self, guild: discord.Guild, usernames):
+        """
+        Returns the members of a guild with the given full usernames, as a dict
+        from username to member. Usernames not in the guild are left out.
+        """
+        now = time.monotonic()
+        self.prune(guild.id, now)
+
+        if now - self.filled_at.get(guild.id, -self.id_map_ttl) >= self.id_map_ttl:
+            try:
+                await self.fill_ids(guild, set(usernames), now)
+            except discord.HTTPException:
+                # Names are queried one at a time until the list can be had
+                pass
+
+        # With the member list downloaded, usernames it doesn't have aren't in
+        # the guild, apart from members who joined since (who are added as
+        # they join)
+        filled = guild.id in self.filled_at
+
+        guild_ids = self.ids_by_username.get(guild.id, {})
+        guild_members = self.members.get(guild.id, {})
+        guild_missing = self.missing.get(guild.id, {})
+
+        stale_ids = []
+        unknown_usernames = []
+
+        for username in usernames:
+            if (member_id := guild_ids.get(username)) is not None:
+                if guild_members.get(member_id, (None, 0.0))[1] <= now:
+                    stale_ids.append(member_id)
+            elif not filled and guild_missing.get(username, 0.0) <= now:
+                unknown_usernames.append(username)
+
+        # Members sharing a name are found by the same query. Only
+        # `QUERY_LIMIT` members are returned per name, so very common names can
+        # be missed until the member is seen joining.
+        names = list({username.rpartition("#")[0] for username in unknown_usernames})
+        id_batches = [stale_ids[idx:idx + QUERY_LIMIT]
+                      for idx in range(0, len(stale_ids), QUERY_LIMIT)]
+
+        results = await asyncio.gather(
+            *(self.query(guild, user_ids=batch) for batch in id_batches),
+            *(self.query(guild, query=name) for name in names))
+
+        wanted = set(usernames)
+
+        for batch, members in zip(id_batches, results):
+            if members is None:
+                continue
+
+            for member in members:
+                self.add(member, now)
+
+            # Known members that weren't returned have left the guild
+            for member_id in set(batch).difference(member.id for member in members):
+                self.forget(guild.id, member_id)
+
+        for members in results[len(id_batches):]:
+            for member in members or ():
+                if full_username(member) in wanted:
+                    self.add(member, now)
+
+        guild_ids = self.ids_by_username.get(guild.id, {})
+        guild_members = self.members.get(guild.id, {})
+        resolved = {}
+
+        for username in usernames:
+            if (entry := guild_members.get(guild_ids.get(username))) is not None:
+                resolved[username] = entry[0]
+
+        for username in unknown_usernames:
+            if username not in resolved:
+                self.missing.setdefault(guild.id, {})[username] = now + self.ttl
+
+        return resolved
+
+    async def get_member(self, guild: discord.Guild, member_id: int):
+        """
+        Returns the member of a guild with the given id, or None if they
+        aren't in it.
+        """
+        now = time.monotonic()
+
+        if (entry := self.members.get(guild.id, {}).get(member_id)) is not None and entry[1] > now:
+            return entry[0]
+
+        if not (members := await self.query(guild, user_ids=[member_id])):
+            return None
+
+        self.add(members[0], now)
+        return members[0]
+
+    async def role_members(self, guild: discord.Guild, role: discord.Role):
+        """
+        Returns the members of a guild that have a role, without caching them.
+        """
+        return [member async for member in guild.fetch_members(limit=None)
+                if role in member.roles]
@@ -0,0 +1,149 @@
+import asyncio
+import contextlib
+import os
+import time
+
+# Descriptions of every counter, used for the Prometheus export
+COUNTERS = {
+    "cycles": "Sheet polls completed",
+    "rows_fetched": "Rows fetched from Google Sheets",
+    "malformed_rows": "Fetched rows skipped because they were malformed",
+    "members_skipped": "Respondents skipped because their verification was already applied",
+    "members_changed": "Members whose nickname or roles were edited",
+    "discord_api_calls": "Discord API actions run through the scheduler",
+    "rate_limit_wait_seconds": "Seconds background actions waited for their rate budget",
+    "fetch_retries": "Sheet fetches retried after transient errors",
+    "breaker_opens": "Times a spreadsheet stopped being fetched after failing",
+    "errors": "Errors during verification"
+}
+
+# Phases of the verification pipeline, in the order they run
+PHASES = ["fetch", "sort", "validate", "member_index", "discord_write"]
+
+
+class PhaseTiming:
+    __slots__ = ("last", "total", "count")
+
+    def __init__(self):
+        self.last = 0.0
+        self.total = 0.0
+        self.count = 0
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class Metrics:
+    """
+    Collects durations and counters for the verification pipeline.
+
+    The numbers can be shown with `verify stats` or exported in the Prometheus
+    text format for node_exporter's textfile collector.
+
+    When several processes each run some of the bot's shards, each one is
+    given a `shard` name (e.g. `0-1`). Its metrics are then labelled with it
+    and exported to a file of its own, so the processes neither overwrite
+    each other's file nor export clashing series.
+    """
+
+    def __init__(self, shard: str = None):
+        self.shard = shard
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.phases = {phase: PhaseTiming() for phase in PHASES}
+
+    def increment(self, counter: str, amount=1):
+        self.counters[counter] += amount
+
+    def record(self, phase: str, seconds: float):
+        timing = self.phases[phase]
+        timing.last = seconds
+        timing.total += seconds
+        timing.count += 1
+
+    @contextlib.contextmanager
+    def time(self, phase: str):
+        """
+        Times the enclosed block as a run of the given phase.
+        """
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def labels(self, **labels):
+        """
+        Formats the labels of a series, including the shard label if any.
+        """
+        if self.shard is not None:
+            labels["shard"] = self.shard
+
+        if not labels:
+            return ""
+
+        return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+    def file_path(self, path: str):
+        """
+        Returns the file this process exports to, given the configured one.
+        """
+        if self.shard is None:
+            return path
+
+        root, extension = os.path.splitext(path)
+        return f"{root}.shard{self.shard}{extension}"
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP authbot_phase_seconds_total Time spent in each verification phase",
+            "# TYPE authbot_phase_seconds_total counter"
+        ]
+        lines += [f"authbot_phase_seconds_total{self.labels(phase=phase)} {timing.total}"
+                  for phase, timing in self.phases.items()]
+
+        lines += [
+            "# HELP authbot_phase_runs_total Number of runs of each verification phase",
+            "# TYPE authbot_phase_runs_total counter"
+        ]
+        lines += [f"authbot_phase_runs_total{self.labels(phase=phase)} {timing.count}"
+                  for phase, timing in self.phases.items()]
+
+        lines += [
+            "# HELP authbot_phase_last_seconds Duration of the last run of each verification phase",
+            "# TYPE authbot_phase_last_seconds gauge"
+        ]
+        lines += [f"authbot_phase_last_seconds{self.labels(phase=phase)} {timing.last}"
+                  for phase, timing in self.phases.items()]
+
+        for counter, description in COUNTERS.items():
+            lines += [
+                f"# HELP authbot_{counter}_total {description}",
+                f"# TYPE authbot_{counter}_total counter",
+                f"authbot_{counter}_total{self.labels()} {self.counters[counter]}"
+            ]
+
+        return "\n".join(lines) + "\n"
+
+    async def export(self, path: str):
+        """
+        Writes the metrics to a file in the Prometheus text format. With a
+        shard name, the name is added to the file name (`authbot.prom`
+        becomes e.g. `authbot.shard0-1.prom`).
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, write_atomically, self.file_path(path),
+                                   self.prometheus_text())
+
+
+def write_atomically(path: str, text: str):
+    """
+    Writes a file by replacing it, so that readers never see a partial file.
+    """
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "w") as temp_file:
+        temp_file.write(text)
+
+    os.replace(temp_path, path)
@@ -1,15 +1,23 @@
 import discord
 from discord.ext import commands
-import pickle
-import os
 
+from list_pages import ListPages, page_embed, role_mention
+from storage import Storage
 import utilities
 
 
 class Modrole(commands.Cog, name="Moderation"):
-    def __init__(self, bot: commands.Bot):
+    def __init__(self, bot: commands.Bot, storage: Storage):
         self.bot = bot
-        self.modroles = self.load_if_exists("modroles.pickle")
+        self.storage = storage
+        self.modroles = storage.load_modroles()
+
+        # Frozen sets of each guild's modrole ids for the command check, which
+        # are dropped whenever that guild's modroles change
+        self.modrole_id_cache = {}
+
+        # Rendered pages of `modrole list`
+        self.list_pages = ListPages()
 
         # Add the corresponding modrole check to the supplied bot.
         self.bot.add_check(self.mods_only)
@@ -37,16 +45,20 @@ class Modrole(commands.Cog, name="Moderation"):
 
         modrole_list = self.modroles[ctx.guild.id]
 
+        added_ids = []
+
         # Add modrole ids to self.modroles under guild id key
         for role in role_mentions:
             if role.id not in modrole_list:
                 modrole_list.append(role.id)
+                added_ids.append(role.id)
 
             else:
                 await ctx.send(f"{role.name} is already a modrole.")
 
         # Write changes to storage
-        self.write_modrole_changes()
+        await self.storage.add_modroles(ctx.guild.id, added_ids)
+        self.modroles_changed(ctx.guild.id)
 
         # Make a message with all of the supplied role names
         role_names = [role.name for role in role_mentions]
@@ -68,6 +80,7 @@ class Modrole(commands.Cog, name="Moderation"):
         self.ensure_modroles_exist(ctx.guild.id)
 
         removed_roles = []
+        removed_ids = []
 
         # Check if the supplied role(s) are actually modroles
         for role in role_mentions:
@@ -78,64 +91,70 @@ class Modrole(commands.Cog, name="Moderation"):
 
             role_list.remove(role.id)
             removed_roles.append(role.name)
+            removed_ids.append(role.id)
 
-        self.write_modrole_changes()
+        await self.storage.remove_modroles(ctx.guild.id, removed_ids)
+        self.modroles_changed(ctx.guild.id)
 
         role_list_message = ("Modroles removed: " + utilities.pretty_print_list(
             removed_roles)) or "There are no modroles for this guild."
 
         await ctx.send(role_list_message)
 
-    @modrole.command(usage="list")
-    async def list(self, ctx: commands.Context):
+    @modrole.command(usage="list [page]")
+    async def list(self, ctx: commands.Context, page: int = 1):
         """
         Lists all modroles for the current guild.
+        Long lists are split into pages.
         """
-        list_embed = discord.Embed(title="Moderator Roles",
-                                   color=discord.Color.orange())
-
         self.ensure_modroles_exist(ctx.guild.id)
-        self.write_modrole_changes()
-
-        # Create a list of all modroles from their ids
         modrole_ids = self.modroles[ctx.guild.id]
-        guild_modrole_mentions = []
 
-        for role_id in modrole_ids:
-            role = ctx.guild.get_role(role_id)
-            guild_modrole_mentions.append(role.mention)
+        def render():
+            return [role_mention(role_id) for role_id in modrole_ids]
+
+        pages = self.list_pages.get("modroles", ctx.guild.id, render)
+
+        await ctx.send(embed=page_embed("Moderator Roles", discord.Color.orange(), pages,
+                                        page, "There are no modroles for this guild."))
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        """
+        Removes deleted roles from their guild's modroles.
+        """
+        if role.id not in self.guild_modrole_ids(role.guild.id):
+            return
+
+        self.modroles[role.guild.id].remove(role.id)
+        await self.storage.remove_modroles(role.guild.id, [role.id])
+        self.modroles_changed(role.guild.id)
 
-        list_embed.description = utilities.pretty_print_list(
-            guild_modrole_mentions) or "There are no modroles for this guild."
+    def modroles_changed(self, guild_id: discord.Guild.id):
+        # Drop everything derived from the guild's modroles
+        self.modrole_id_cache.pop(guild_id, None)
+        self.list_pages.invalidate("modroles", guild_id)
 
-        await ctx.send(embed=list_embed)
+    def guild_modrole_ids(self, guild_id: discord.Guild.id):
+        if (modrole_ids := self.modrole_id_cache.get(guild_id)) is None:
+            modrole_ids = frozenset(self.modroles.get(guild_id, ()))
+            self.modrole_id_cache[guild_id] = modrole_ids
+
+        return modrole_ids
 
     def mods_only(self, ctx: commands.Context):
-        self.ensure_modroles_exist(ctx.guild.id)
         # Check guild modroles
-        for role_id in self.modroles[ctx.guild.id]:
-            role = ctx.guild.get_role(role_id)
+        modrole_ids = self.guild_modrole_ids(ctx.guild.id)
 
-            if role in ctx.author.roles:
-                return True
+        if not modrole_ids.isdisjoint(role.id for role in ctx.author.roles):
+            return True
 
         # Allow the server owner to run commands regardless of their roles
-        if ctx.author == ctx.guild.owner:
+        if ctx.author.id == ctx.guild.owner_id:
             return True
 
         return False
 
-    def write_modrole_changes(self):
-        with open("modroles.pickle", "wb") as mod_file:
-            pickle.dump(self.modroles, mod_file)
-
     def ensure_modroles_exist(self, guild_id: discord.Guild.id):
         if self.modroles.get(guild_id) is None:
             self.modroles[guild_id] = []
-
-    def load_if_exists(self, file):
-        if os.path.exists("modroles.pickle"):
-            with open("modroles.pickle", "rb") as mod_file:
-                return pickle.load(mod_file)
-
-        return {}
@@ -0,0 +1,46 @@
+import functools
+import re
+from typing import NamedTuple, Optional
+
+# Matches the letters (and the numbers after them) of a school username
+SCHOOL_USERNAME_REGEX = re.compile(r"^(\D+)\d+")
+
+
+class ValidatedRow(NamedTuple):
+    # The school username from the response's email, if it has one
+    school_username: Optional[str]
+    # Whether the nickname in the response matches the school username
+    nickname_valid: bool
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def validate(email: str, nickname: str):
+    """
+    Checks a form response's nickname against the school username in its email.
+
+    A nickname is valid if it starts with the first initial from the username
+    and contains the last initial somewhere after it. Results are cached by
+    the response's contents, so unchanged rows are only checked once.
+    """
+    if (username_match := SCHOOL_USERNAME_REGEX.search(email)) is None:
+        return ValidatedRow(None, False)
+
+    # Usernames are the last name followed by the first initial
+    user_name_fragment = username_match.group(1)
+    user_first_initial = user_name_fragment[-1]
+    user_last_initial = user_name_fragment[0]
+
+    test_nick = nickname.lower()
+    nickname_valid = (test_nick.startswith(user_first_initial) and
+                      user_last_initial in test_nick)
+
+    return ValidatedRow(username_match.group(0), nickname_valid)
+
+
+def validate_responses(responses):
+    """
+    Validates a batch of form responses at once, storing each response's
+    `ValidatedRow` in its `validated` attribute.
+    """
+    for response in responses:
+        response.validated = validate(response.email, response.nickname)
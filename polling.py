@@ -0,0 +1,69 @@
+import hashlib
+import time
+
+# How many rows at the end of the sheet are hashed to detect changes
+TAIL_ROWS = 50
+
+
+def tail_hash(snapshots):
+    """
+    Hashes the number of rows and the last few rows of each sheet snapshot,
+    given as (row count, last rows) pairs.
+
+    Forms only ever append rows, so this changes whenever a response comes in.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    for row_count, tail in snapshots:
+        digest.update(str(row_count).encode())
+
+        for row in tail[-TAIL_ROWS:]:
+            digest.update(repr(row).encode())
+
+    return digest.digest()
+
+
+class AdaptivePoller:
+    """
+    Decides when the sheet should be polled next.
+
+    The interval doubles (up to `max_seconds`) every time a poll finds nothing
+    new, and drops back to `min_seconds` as soon as the sheet changes. The
+    verification loop ticks every `min_seconds` and skips ticks until a poll
+    is due.
+    """
+
+    def __init__(self, min_seconds: float, max_seconds: float, backoff=2.0):
+        self.min_seconds = min_seconds
+        self.max_seconds = max(min_seconds, max_seconds)
+        self.backoff = backoff
+
+        self.interval = min_seconds
+        self.next_poll = 0.0
+        self.last_hash = None
+
+    def due(self):
+        return time.monotonic() >= self.next_poll
+
+    def reset(self):
+        """
+        Makes the next tick poll and return to the shortest interval.
+        """
+        self.interval = self.min_seconds
+        self.next_poll = 0.0
+        self.last_hash = None
+
+    def observe(self, snapshots):
+        """
+        Records the result of a poll (the rows of every polled sheet) and
+        returns the interval until the next one.
+        """
+        if (snapshot_hash := tail_hash(snapshots)) != self.last_hash:
+            self.interval = self.min_seconds
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_seconds)
+
+        self.last_hash = snapshot_hash
+        self.next_poll = time.monotonic() + self.interval
+
+        return self.interval
@@ -0,0 +1,21 @@
+import discord
+
+
+def desired_changes(member: discord.Member, nick: str, verified_role: discord.Role):
+    """
+    Compares a member's current state with the state they should be in after
+    verification.
+
+    Returns the keyword arguments for a single `member.edit` call that brings
+    them to that state, which is empty if nothing needs to change.
+    """
+    changes = {}
+
+    if member.nick != nick:
+        changes["nick"] = nick
+
+    if verified_role not in member.roles:
+        # The first role is always @everyone, which can't be assigned
+        changes["roles"] = member.roles[1:] + [verified_role]
+
+    return changes
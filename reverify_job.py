@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+from storage import Storage
+
+# Number of members reverified at the same time
+CONCURRENCY = 4
+
+# Seconds between progress saves and progress message updates
+CHECKPOINT_INTERVAL = 5
+
+
+class ReverifyJob:
+    """
+    Reverifies every member of a role in the background.
+
+    Progress is saved to storage every few seconds so that an interrupted job
+    can be resumed (see `Storage.load_reverify_jobs`), and a progress message
+    in the channel the job was started from is kept up to date.
+
+    `reverify_member` is a coroutine function taking a member and the role
+    being reverified, which does the actual reverification. `get_member` is a
+    coroutine function taking the guild and a member id, which returns the
+    member or None if they left.
+    """
+
+    def __init__(self, guild: discord.Guild, role: discord.Role,
+                 channel: discord.TextChannel, member_ids, storage: Storage,
+                 reverify_member, get_member, logger: logging.Logger, total=None,
+                 failed=0, message: discord.Message = None):
+        self.guild = guild
+        self.role = role
+        self.channel = channel
+        self.pending_ids = list(member_ids)
+        self.storage = storage
+        self.reverify_member = reverify_member
+        self.get_member = get_member
+        self.logger = logger
+
+        self.total = total if total is not None else len(self.pending_ids)
+
+        # Members finished after the last checkpoint of an interrupted job are
+        # reverified again, so its progress is counted from the ids still
+        # pending rather than trusted from the stored counts
+        processed = max(self.total - len(self.pending_ids), 0)
+        self.failed = min(failed, processed)
+        self.done = processed - self.failed
+        self.message = message
+
+        # Member ids finished since the last checkpoint
+        self.finished_ids = []
+        self.last_checkpoint = time.monotonic()
+        self.checkpoint_lock = asyncio.Lock()
+        self.task = None
+
+    @property
+    def key(self):
+        return self.guild.id, self.role.id
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    def progress_text(self):
+        return (f"Reverifying {self.role.name}: {self.done + self.failed}/{self.total} "
+                f"members ({self.failed} failed)")
+
+    async def run(self):
+        if self.message is None:
+            self.message = await self.channel.send(self.progress_text())
+            await self.storage.create_reverify_job(
+                self.guild.id, self.role.id, self.channel.id, self.message.id,
+                self.total, self.pending_ids)
+
+        # Every worker pulls member ids from the same iterator
+        member_ids = iter(self.pending_ids)
+
+        async def worker():
+            for member_id in member_ids:
+                await self.reverify(member_id)
+
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+
+        await self.storage.finish_reverify_job(self.guild.id, self.role.id)
+        await self.update_message(
+            f"Done reverifying {self.role.name}: {self.done} reverified, "
+            f"{self.failed} failed.")
+
+    async def reverify(self, member_id: int):
+        # Any error only fails this member, since the job would otherwise stop
+        # and be resumed (and fail again) on every restart
+        try:
+            # Members who left the guild don't need to be reverified
+            if (member := await self.get_member(self.guild, member_id)) is not None:
+                await self.reverify_member(member, self.role)
+        except Exception as e:
+            self.logger.error("Failed to reverify member %s: %s", member_id, e)
+            self.failed += 1
+        else:
+            self.done += 1
+
+        self.finished_ids.append(member_id)
+
+        if time.monotonic() - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+            await self.checkpoint()
+
+    async def checkpoint(self):
+        """
+        Saves the job's progress and updates the progress message.
+        """
+        if self.checkpoint_lock.locked():
+            return
+
+        async with self.checkpoint_lock:
+            finished_ids, self.finished_ids = self.finished_ids, []
+            self.last_checkpoint = time.monotonic()
+
+            # The finished ids and the counts are saved in one transaction
+            try:
+                await self.storage.checkpoint_reverify_job(
+                    self.guild.id, self.role.id, finished_ids, self.done, self.failed)
+            except Exception as e:
+                self.logger.error("Failed to save reverify progress: %s", e)
+                self.finished_ids = finished_ids + self.finished_ids
+                return
+
+            await self.update_message(self.progress_text())
+
+    async def update_message(self, content: str):
+        try:
+            await self.message.edit(content=content)
+        except discord.HTTPException as e:
+            self.logger.error("Failed to update reverify progress: %s", e)
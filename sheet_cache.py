@@ -0,0 +1,98 @@
+import os
+import socket
+import time
+
+import sheets
+from storage import Storage
+
+# Seconds a process may spend fetching a sheet before another one takes over
+LEASE_SECONDS = 2 * sheets.HTTP_TIMEOUT
+
+
+class SheetCache:
+    """
+    Shares fetched sheet rows between bot processes through the database, so
+    that every sheet is fetched from Google once per cycle however many
+    processes (shards) verify guilds reading from it.
+
+    The first process to poll a sheet that hasn't been fetched in the last
+    `fresh_seconds` takes a lease on it, fetches the new rows and stores them.
+    Every other process reads the stored rows instead. Cursors are kept in
+    step with the stored rows, so a process taking over the fetching carries
+    on where the last one stopped.
+    """
+
+    def __init__(self, storage: Storage, fresh_seconds=None):
+        self.storage = storage
+        self.fresh_seconds = (sheets.config.poll_min_seconds if fresh_seconds is None
+                              else fresh_seconds)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+
+        # Sheet source -> generation of the stored rows last read
+        self.generations = {}
+
+    async def catch_up(self, cursor: sheets.SheetCursor, state: dict):
+        """
+        Reads the stored rows a cursor hasn't seen yet. Returns the rows and
+        whether they replace all previous ones.
+        """
+        source = cursor.source
+
+        # Rows are re-read from the start after a full re-read of the sheet
+        full_resync = (cursor.row_count == 0 or
+                       self.generations.get(source) != state["generation"])
+        start = 0 if full_resync else cursor.row_count
+
+        rows = await self.storage.load_sheet_rows(*source, start)
+        cursor.apply(rows, full_resync)
+        cursor.cycles_since_resync = state["cycles_since_resync"]
+        self.generations[source] = state["generation"]
+
+        return rows, full_resync
+
+    async def fetch_cursors(self, client: sheets.SheetsClient, cursors,
+                            fetch=sheets.fetch_cursors):
+        """
+        Works like `sheets.fetch_cursors`, but only fetches sheets from Google
+        (with `fetch`) if no other process has done so this cycle.
+
+        `fetch` may leave out cursors it couldn't fetch, in which case another
+        process can try to fetch them right away. Cursors whose sheet has never
+        been fetched by any process are left out too until it has been.
+        """
+        results = {}
+        leased = []
+
+        for cursor in cursors:
+            if (state := await self.storage.load_sheet_fetch(*cursor.source)) is not None:
+                results[cursor] = await self.catch_up(cursor, state)
+
+            if await self.storage.acquire_fetch_lease(
+                    *cursor.source, self.holder, time.time(), LEASE_SECONDS,
+                    self.fresh_seconds):
+                leased.append(cursor)
+
+        if not leased:
+            return results
+
+        start_rows = {cursor: cursor.row_count for cursor in leased}
+
+        fetched = await fetch(client, leased)
+
+        for cursor in leased:
+            if cursor not in fetched:
+                await self.storage.release_fetch_lease(*cursor.source, self.holder)
+
+        for cursor, (rows, full_resync) in fetched.items():
+            start = 0 if full_resync else start_rows[cursor]
+            self.generations[cursor.source] = await self.storage.store_sheet_rows(
+                *cursor.source, rows, start, full_resync, cursor.cycles_since_resync,
+                time.time())
+
+            if full_resync or cursor not in results:
+                results[cursor] = (rows, full_resync)
+            else:
+                cached_rows, cached_full_resync = results[cursor]
+                results[cursor] = (cached_rows + rows, cached_full_resync)
+
+        return results
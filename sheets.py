@@ -1,21 +1,95 @@
+import asyncio
+import functools
 import pickle
 import os
+import re
 import yaml
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from polling import TAIL_ROWS
+from snapshot import DEFAULT_COLUMNS
+
+# The Google API client libraries are slow to import, so they are only
+# imported once they're used (see `verify_credentials` and `get_service`)
 
 # Only open the spreadsheet as read-only
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
 
-# Load spreadsheet information from configuration file
-SPREADSHEET_ID = ""
-RANGE_NAME = ""
+# Where the Google credentials are saved between runs
+TOKEN_FILE = "token.pickle"
+
+# Timeout (in seconds) for requests to the Google Sheets API
+HTTP_TIMEOUT = 30
+
+# Bounds (in seconds) for how often the sheet is polled
+POLL_MIN_SECONDS = 30
+POLL_MAX_SECONDS = 600
+
+# Where verification metrics are written in the Prometheus text format
+METRICS_FILE = "authbot.prom"
+
+# Number of incremental fetches between full re-reads of the sheet (0 disables
+# incremental fetching altogether)
+FULL_RESYNC_CYCLES = 20
+
+
+class SheetsConfig:
+    """
+    Settings from sheetsconfig.yaml. The file is only read the first time a
+    setting is used, and the constants above are the defaults for optional
+    settings.
+    """
+
+    def __init__(self, path="sheetsconfig.yaml"):
+        self.path = path
+
+    @functools.cached_property
+    def values(self):
+        with open(self.path, "r") as config_file:
+            return yaml.safe_load(config_file)
+
+    @functools.cached_property
+    def spreadsheet_id(self):
+        return self.values["spreadsheet_id"]
+
+    @functools.cached_property
+    def range_name(self):
+        return self.values["range_name"]
+
+    @functools.cached_property
+    def full_resync_cycles(self):
+        return self.values.get("full_resync_cycles", FULL_RESYNC_CYCLES)
+
+    @functools.cached_property
+    def poll_min_seconds(self):
+        return self.values.get("poll_min_seconds", POLL_MIN_SECONDS)
+
+    @functools.cached_property
+    def poll_max_seconds(self):
+        return self.values.get("poll_max_seconds", POLL_MAX_SECONDS)
+
+    @functools.cached_property
+    def metrics_file(self):
+        return self.values.get("metrics_file", METRICS_FILE)
+
+    @functools.cached_property
+    def columns(self):
+        # Position of each field within the fetched range
+        return {**DEFAULT_COLUMNS, **(self.values.get("columns") or {})}
 
-with open("sheetsconfig.yaml", "r") as config:
-    config_obj = yaml.safe_load(config)
-    SPREADSHEET_ID = config_obj["spreadsheet_id"]
-    RANGE_NAME = config_obj["range_name"]
+    @functools.cached_property
+    def default_source(self):
+        # The source used by guilds that haven't set their own
+        return SheetSource(self.spreadsheet_id, self.range_name)
+
+
+config = SheetsConfig()
+
+# Matches A1 notation ranges like "Form Responses 1!B2:D" or "A:C"
+A1_RANGE_REGEX = re.compile(
+    r"^(?:(?P<sheet>.+)!)?(?P<start_col>[A-Za-z]+)(?P<start_row>\d*)"
+    r":(?P<end_col>[A-Za-z]+)(?P<end_row>\d*)$")
 
 
 class CredentialError(ValueError):
@@ -25,10 +99,13 @@ class CredentialError(ValueError):
 
 # NOTE: This function was taken from the Google Sheets API Quickstart page
 def verify_credentials():
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
     credentials = None
 
-    if os.path.exists("token.pickle"):
-        with open("token.pickle", "rb") as token:
+    if os.path.exists(TOKEN_FILE):
+        with open(TOKEN_FILE, "rb") as token:
             credentials = pickle.load(token)
 
     if not credentials or not credentials.valid:
@@ -39,8 +116,7 @@ def verify_credentials():
                 "credentials.json", SCOPES)
             credentials = flow.run_local_server(port=0)
     # Dump credentials to pickle file for later use
-        with open("token.pickle", "wb") as token:
-            pickle.dump(credentials, token)
+        save_credentials(credentials)
 
     return credentials
 
@@ -48,17 +124,203 @@ def verify_credentials():
 # End Google Sheets API Quickstart Code
 
 
-def fetch_data(credentials):
-    if credentials is None:
-        raise CredentialError(
-            "You need to supply credentials via `verify_credentials`.")
-    else:
-        service = build("sheets", "v4", credentials=credentials)
+def save_credentials(credentials, token_file=TOKEN_FILE):
+    """
+    Saves credentials by replacing the token file, so that it's never left
+    half written.
+    """
+    temp_file = token_file + ".tmp"
+
+    with open(temp_file, "wb") as token:
+        pickle.dump(credentials, token)
+
+    os.replace(temp_file, token_file)
+
+
+class SheetSource(NamedTuple):
+    """ A range of a spreadsheet that form responses are read from. """
+    spreadsheet_id: str
+    range_name: str
+
+
+class SheetsClient:
+    """
+    Client for the Google Sheets API that is safe to use from coroutines.
+
+    The API service is only built once and reuses a single keep-alive HTTP
+    connection. Requests are blocking, so they are run on a dedicated worker
+    thread instead of the event loop.
+    """
+
+    def __init__(self, credentials):
+        if credentials is None:
+            raise CredentialError(
+                "You need to supply credentials via `verify_credentials`.")
+
+        self.credentials = credentials
+        self.service = None
+
+        # httplib2 connections aren't thread safe, so every request goes
+        # through the same (single) worker thread
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sheets")
+
+    def get_service(self):
+        if self.service is None:
+            import httplib2
+            from googleapiclient.discovery import build
+            from google_auth_httplib2 import AuthorizedHttp
+
+            http = AuthorizedHttp(
+                self.credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            self.service = build("sheets", "v4", http=http,
+                                 cache_discovery=False)
 
+        return self.service
+
+    def batch_get(self, spreadsheet_id: str, ranges: list):
+        """
+        Fetches the values of several ranges of a spreadsheet with a single
+        request. This blocks, so use `batch_fetch` from within coroutines.
+
+        Returns a list of each range's values, in the same order as `ranges`.
+        """
         # Call sheets API
-        sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=SPREADSHEET_ID,
-                                    range=RANGE_NAME).execute()
-        values = result.get("values") or []
+        sheet = self.get_service().spreadsheets()
+        result = sheet.values().batchGet(spreadsheetId=spreadsheet_id,
+                                         ranges=ranges).execute()
+
+        return [value_range.get("values") or []
+                for value_range in result.get("valueRanges", [])]
+
+    def fetch_all(self, requests: dict):
+        results = {}
+
+        for spreadsheet_id, ranges in requests.items():
+            values = self.batch_get(spreadsheet_id, ranges)
+            results.update(((spreadsheet_id, range_name), range_values)
+                           for range_name, range_values in zip(ranges, values))
+
+        return results
+
+    async def batch_fetch(self, requests: dict):
+        """
+        Fetches ranges from several spreadsheets, using one request per
+        spreadsheet.
+
+        `requests` maps spreadsheet ids to lists of ranges. Returns a dictionary
+        of (spreadsheet id, range) pairs to their values.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.fetch_all, requests)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class SheetCursor:
+    """
+    Keeps track of how many rows of a form response sheet have already been
+    fetched so that only newly appended rows have to be requested.
+
+    Google Forms only ever appends rows, but responses can still be edited or
+    deleted by hand, so the whole range is re-read every `resync_cycles`
+    fetches.
+    """
+
+    def __init__(self, source: SheetSource, resync_cycles=None):
+        self.source = source
+        self.resync_cycles = (config.full_resync_cycles if resync_cycles is None
+                              else resync_cycles)
+        self.cycles_since_resync = 0
+
+        # Only the number of fetched rows and the last few of them (for
+        # detecting changes) are kept; the responses themselves are kept in
+        # the snapshot
+        self.row_count = 0
+        self.tail = []
+
+        self.range_match = A1_RANGE_REGEX.match(source.range_name)
+
+    def tail_range(self):
+        """
+        Returns the A1 range covering every row after the ones already fetched,
+        or None if the configured range is already exhausted.
+        """
+        sheet = self.range_match.group("sheet")
+        start_row = int(self.range_match.group("start_row") or 1)
+        end_row = self.range_match.group("end_row")
+
+        next_row = start_row + self.row_count
+
+        if end_row and next_row > int(end_row):
+            return None
+
+        tail = (f"{self.range_match.group('start_col')}{next_row}:"
+                f"{self.range_match.group('end_col')}{end_row}")
+
+        return f"{sheet}!{tail}" if sheet is not None else tail
+
+    def reset(self):
+        """
+        Forgets every fetched row, so the next fetch re-reads the whole range.
+        """
+        self.row_count = 0
+        self.tail = []
+
+    def needs_resync(self):
+        # Ranges that can't be parsed (e.g. named ranges) are always fully read
+        if self.range_match is None or self.resync_cycles <= 0:
+            return True
+
+        return self.row_count == 0 or self.cycles_since_resync >= self.resync_cycles
+
+    def next_range(self):
+        """
+        Returns the range to fetch next (None if there is nothing to fetch)
+        and whether it re-reads the whole source.
+        """
+        if self.needs_resync():
+            return self.source.range_name, True
+
+        return self.tail_range(), False
+
+    def apply(self, rows: list, full_resync: bool):
+        """
+        Records the rows fetched from the range given by `next_range`.
+        """
+        if full_resync:
+            self.row_count = len(rows)
+            self.tail = rows[-TAIL_ROWS:]
+            self.cycles_since_resync = 0
+        else:
+            self.row_count += len(rows)
+            self.tail = (self.tail + rows)[-TAIL_ROWS:]
+            self.cycles_since_resync += 1
+
+
+async def fetch_cursors(client: SheetsClient, cursors):
+    """
+    Fetches any rows that haven't been seen yet for every cursor, batching
+    ranges from the same spreadsheet into a single request.
+
+    Returns a dictionary of cursors to a tuple of their fetched rows and
+    whether the whole range was re-read, in which case the returned rows
+    replace all previous ones.
+    """
+    plans = {cursor: cursor.next_range() for cursor in cursors}
+    requests = {}
+
+    for cursor, (range_name, full_resync) in plans.items():
+        if range_name is not None:
+            requests.setdefault(cursor.source.spreadsheet_id, []).append(range_name)
+
+    values = await client.batch_fetch(requests) if requests else {}
+    results = {}
+
+    for cursor, (range_name, full_resync) in plans.items():
+        rows = values.get((cursor.source.spreadsheet_id, range_name), [])
+        cursor.apply(rows, full_resync)
+        results[cursor] = (rows, full_resync)
 
-        return values
+    return results
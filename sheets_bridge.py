@@ -1,27 +1,137 @@
 import sheets
 from discord.ext import commands, tasks
+import asyncio
+import functools
 import logging
+import time
 import discord
-import os
-import pickle
-import re
 
+from action_scheduler import ActionScheduler, Priority
+from applied_state import AppliedStates, outcome_digest
+from circuit_breaker import BreakerState, CircuitBreaker
+from credential_manager import CredentialManager
+from dm_outbox import DMOutbox
+from guild_worker import GuildConfigError, GuildWorker
+from list_pages import ListPages, page_embed, role_mention, user_mention
+from member_index import MemberIndex, full_username
+from member_resolver import MemberResolver
+from metrics import Metrics
+from polling import AdaptivePoller
+from reverify_job import ReverifyJob
+from sheet_cache import SheetCache
+from storage import Storage, empty_guild_data
+import circuit_breaker
+import nickname_validation
+import reconcile
+import snapshot
 import utilities
 
+# Number of form respondents looked up in their guild at once
+RESOLVE_BATCH = 100
+
 
 class Verification(commands.Cog):
-    def __init__(self, bot: commands.Bot, sheetsCreds, logger: logging.Logger):
+    def __init__(self, bot: commands.Bot, sheetsCreds, logger: logging.Logger,
+                 storage: Storage, dm_outbox: DMOutbox, light_member_cache=False,
+                 shared_fetch=False, scheduler_options=None, shard_name=None):
         self.bot = bot
         self.creds = sheetsCreds
+
+        # Sheets aren't polled until there is a client (see `start_sheets`)
+        self.sheets_client = None
+        self.credential_manager = None
+
         self.logger = logger
-        self.verifying = False
+        self.dm_outbox = dm_outbox
+
+        if sheetsCreds is not None:
+            self.start_sheets(sheetsCreds)
+
+        # Guild id -> verification worker, for guilds that have been started
+        self.workers = {}
+
+        self.storage = storage
+        self.guild_data = storage.load_guild_data()
+
+        # What verification last applied to each respondent, so that unchanged
+        # respondents aren't looked up again (e.g. after a restart)
+        self.applied = AppliedStates(storage.load_applied_states())
+
+        # Verification is resumed in the guilds it was running in before a
+        # restart once the bot is first ready
+        self.resumed = False
+        self.started_at = time.time()
 
-        self.guild_data = self.read_pickle_if_exists("guild_data.pickle", {})
+        # Each of these is keyed by sheet source, since guilds can read their
+        # responses from different sheets
         self.sheets_data = {}
+        self.sheet_cursors = {}
+
+        # When several processes (shards) share the database, fetched rows are
+        # shared through it so every sheet is only fetched once per cycle
+        self.sheet_cache = SheetCache(storage) if shared_fetch else None
+
+        # Spreadsheet id -> circuit breaker, which stops fetching spreadsheets
+        # that keep failing for a while
+        self.breakers = {}
+
+        # The loop ticks at the shortest polling interval, but only polls the
+        # sheet when the poller says so
+        self.poller = AdaptivePoller(
+            sheets.config.poll_min_seconds, sheets.config.poll_max_seconds)
+        self.update_data.change_interval(seconds=sheets.config.poll_min_seconds)
+
+        # Full usernames of guild members, kept up to date by the listeners
+        # below. Without the member cache, members are looked up on demand.
+        self.light_member_cache = light_member_cache
+        self.member_index = MemberResolver() if light_member_cache else MemberIndex()
+
+        # Timings and counters for `verify stats` and the Prometheus export.
+        # Processes that only run some of the shards export them separately.
+        self.metrics = Metrics(shard=shard_name)
+
+        # Every Discord write from this cog goes through the scheduler, whose
+        # limits can be changed in the `scheduler` section of botconfig.yaml
+        self.scheduler = ActionScheduler(metrics=self.metrics, **(scheduler_options or {}))
+
+        # (Guild id, role id) -> running bulk reverify job
+        self.reverify_jobs = {}
+
+        # Rendered pages of `ignore list` and `override list`
+        self.list_pages = ListPages()
+
+    def start_sheets(self, sheetsCreds):
+        """
+        Starts polling sheets with the given credentials. The bot connects to
+        Discord before the credentials are loaded, so this is called once
+        they are.
+        """
+        self.creds = sheetsCreds
+        self.sheets_client = sheets.SheetsClient(sheetsCreds)
+
+        # Tokens are refreshed before they expire, so fetches never wait on it
+        self.credential_manager = CredentialManager(sheetsCreds, self.logger)
+        self.credential_manager.start()
 
     def cog_unload(self):
         self.update_data.cancel()
 
+        for worker in self.workers.values():
+            worker.cancel()
+
+        # Unfinished reverify jobs are resumed from storage on the next start
+        for job in self.reverify_jobs.values():
+            job.task.cancel()
+
+        if self.sheets_client is not None:
+            self.sheets_client.close()
+
+        if self.credential_manager is not None:
+            self.credential_manager.close()
+
+        self.scheduler.close()
+        self.dm_outbox.close()
+
     @commands.Cog.listener()
     async def on_disconnect(self):
         """
@@ -29,139 +139,631 @@ class Verification(commands.Cog):
         """
         self.update_data.cancel()
 
+        # Unfinished work is kept and resumed after the next poll
+        for worker in self.workers.values():
+            worker.cancel()
+
     @commands.Cog.listener()
     async def on_ready(self):
         """
         Resume the verification loop if it was going before disconnecting/reconnecting.
         """
-        if self.verifying:
+        # Member events may have been missed while disconnected
+        self.member_index.clear()
+
+        if not self.resumed:
+            self.resumed = True
+            await self.resume_verification()
+
+        if self.any_verifying() and not self.update_data.is_running():
             self.update_data.start()
 
+        await self.resume_reverify_jobs()
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.member_index.add(member)
+
+        # Whatever was applied before they left is gone
+        await self.forget_applied(member.guild.id, [member.id])
+
+        # Members who already filled out the form don't have to wait for the
+        # next cycle
+        if self.is_verifying(member.guild.id):
+            await self.verify_new_member(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.member_index.remove(member)
+
+        # Members who rejoin have to be verified again
+        await self.forget_applied(member.guild.id, [member.id])
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if full_username(before) != full_username(after):
+            self.member_index.rename(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        # Username changes are only reported as user updates
+        if full_username(before) != full_username(after):
+            self.member_index.rename(after)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.member_index.clear(guild.id)
+        self.list_pages.clear(guild.id)
+
     @tasks.loop(minutes=3)
     async def update_data(self):
-        unsorted_data = sheets.fetch_data(self.creds)
-        self.sheets_data = self.sort_data(unsorted_data)
+        # Workers can stop themselves if their guild is misconfigured
+        if not self.any_verifying():
+            self.update_data.cancel()
+            return
 
-        self.logger.debug("Current data: %s", self.sheets_data)
+        # Verification carries on once the Sheets API is ready
+        if self.sheets_client is None or not self.poller.due():
+            return
 
-        for guild_id in self.guild_data.keys():
-            # Check if guild data exists and fetch it
-            self.check_guild_data_exists(guild_id)
-            current_guild_data = self.guild_data[guild_id]
+        try:
+            await self.poll_sheets()
+        except Exception:
+            # A failed cycle must not stop the loop, since verification would
+            # then stay stopped until someone restarts it
+            self.logger.exception("Verification cycle failed")
+            self.metrics.increment("errors")
 
-            # Get a reference to the current guild
-            current_guild = self.bot.get_guild(guild_id)
+    async def poll_sheets(self):
+        """
+        Fetches new rows from the sheets of every guild being verified and
+        hands their usernames to the guilds' workers.
+        """
+        # Only the sources of guilds that are being verified are fetched
+        sources = {self.guild_source(guild_id)
+                   for guild_id, worker in self.workers.items() if worker.running}
+        cursors = [self.sheet_cursors.setdefault(source, sheets.SheetCursor(source))
+                   for source in sources]
+
+        # Only rows appended since the last cycle are fetched, except when a
+        # cursor decides to re-read its whole sheet. Sources that can't be
+        # fetched keep their last good snapshot.
+        with self.metrics.time("fetch"):
+            if self.sheet_cache is not None:
+                fetched = await self.sheet_cache.fetch_cursors(
+                    self.sheets_client, cursors, fetch=self.fetch_with_breakers)
+            else:
+                fetched = await self.fetch_with_breakers(self.sheets_client, cursors)
+
+        new_usernames = {}
+
+        for cursor, (new_rows, full_resync) in list(fetched.items()):
+            source = cursor.source
+            self.metrics.increment("rows_fetched", len(new_rows))
+
+            with self.metrics.time("sort"):
+                new_responses, skipped = snapshot.parse_rows(new_rows, sheets.config.columns)
+
+            if skipped:
+                self.logger.warning("Skipped %s malformed rows from %s", skipped, source)
+                self.metrics.increment("malformed_rows", skipped)
+
+            # Nicknames are validated once per cycle instead of once per guild
+            with self.metrics.time("validate"):
+                nickname_validation.validate_responses(new_responses)
+
+            # Members who join later are verified by on_member_join, so only new
+            # responses have to be looked at unless the whole sheet was re-read
+            if full_resync:
+                self.sheets_data[source] = snapshot.SheetSnapshot(new_responses)
+            elif (source_snapshot := self.sheets_data.get(source)) is not None:
+                source_snapshot.extend(new_responses)
+            else:
+                # New rows without the ones before them can't be used, so the
+                # whole sheet is read again next time
+                self.logger.warning("Got new rows of %s without a snapshot, re-reading it",
+                                    source)
+                cursor.reset()
+                del fetched[cursor]
+                continue
+
+            new_usernames[source] = [response.username for response in new_responses]
+
+            self.logger.debug("Current data for %s: %s responses", source,
+                              len(self.sheets_data[source]))
+
+        # Poll again sooner if something changed, and back off otherwise
+        interval = self.poller.observe((cursor.row_count, cursor.tail) for cursor in cursors)
+        self.logger.debug("Next sheet poll in %s seconds", interval)
+
+        # Each guild verifies the usernames from its source on its own worker
+        for guild_id, worker in self.workers.items():
+            worker.submit(new_usernames.get(self.guild_source(guild_id), ()))
+
+        # Fetched rows are kept in the database (which the sheet cache already
+        # does), so a restart carries on from them
+        if self.sheet_cache is None:
+            await self.store_fetched(fetched)
+
+        self.metrics.increment("cycles")
+        await self.metrics.export(sheets.config.metrics_file)
+
+    async def store_fetched(self, fetched):
+        """
+        Stores the rows fetched for each cursor in the database.
+        """
+        for cursor, (rows, full_resync) in fetched.items():
+            start = 0 if full_resync else cursor.row_count - len(rows)
 
-            # Check if the guild has a verified role
-            if (verified_role := current_guild_data.get("verified_role")) is None:
-                # If it doesn't stop verifying (this shouldn't happen, though)
-                self.update_data.cancel()
-                return
+            try:
+                await self.storage.store_sheet_rows(*cursor.source, rows, start, full_resync,
+                                                    cursor.cycles_since_resync, time.time())
+            except Exception as e:
+                self.logger.error("Failed to store rows of %s: %s", cursor.source, e)
 
-            # Organize guild members by username/reference combo in a dictionary
-            guild_usernames = self.guild_member_usernames(current_guild)
+                # Stored rows can't have gaps, so the whole sheet is re-read
+                # (and stored) next cycle
+                cursor.reset()
 
-            # Iterate over people who have filled out Google Form
-            for username in self.sheets_data.keys():
-                # Check if the user actually exists in the guild
-                if username in guild_usernames.keys():
-                    update_member = guild_usernames[username]
+    async def restore_source(self, source: sheets.SheetSource):
+        """
+        Rebuilds the snapshot and cursor of a sheet source from the rows stored
+        in the database, so that only rows added since then are fetched.
+        """
+        if (state := await self.storage.load_sheet_fetch(*source)) is None:
+            return
 
-                    # Ignore user if specified
-                    if self.ignore_member(update_member, guild_id):
-                        continue
+        rows = await self.storage.load_sheet_rows(*source)
 
-                    # This is the name that they put into the Google Form
-                    new_nick = self.sheets_data[username]["nickname"]
-                    school_email = self.sheets_data[username]["email"]
-                    school_username = self.extract_username(school_email).group(0)
+        # Rows stored by an interrupted write are re-read from the sheet
+        if not rows or len(rows) != state["row_count"]:
+            return
 
-                    if not self.nickname_valid(username):
-                        new_nick = school_username
+        cursor = self.sheet_cursors.setdefault(source, sheets.SheetCursor(source))
+        cursor.apply(rows, True)
+        cursor.cycles_since_resync = state["cycles_since_resync"]
 
-                    # Check if the user's nickname has been overridden
-                    if update_member.id in (overrides := current_guild_data["overrides"]).keys():
-                        new_nick = overrides[update_member.id]
+        if self.sheet_cache is not None:
+            self.sheet_cache.generations[source] = state["generation"]
 
-                    # Get the verified role reference through the guild
-                    verified_role_id = current_guild_data["verified_role"]
-                    verified_role = current_guild.get_role(verified_role_id)
+        responses, _ = snapshot.parse_rows(rows, sheets.config.columns)
+        nickname_validation.validate_responses(responses)
+        self.sheets_data[source] = snapshot.SheetSnapshot(responses)
 
-                    # Change the user's nickname and give them the correct role
-                    await update_member.edit(nick=new_nick)
-                    await update_member.add_roles(verified_role)
+        self.logger.info("Restored %s responses of %s", len(responses), source)
 
-    def guild_member_usernames(self, guild: discord.Guild):
-        member_dict = {}
+    async def resume_verification(self):
+        """
+        Resumes verification in the guilds it was running in before a restart.
 
-        # Get the full usernames of users within the guild
-        for member in guild.members:
-            if member != guild.me:
-                fullUsername = member.name + "#" + member.discriminator
-                # TODO: Consider storing the member's id instead of a full reference
-                member_dict[fullUsername] = member
+        Every respondent is checked again, but those whose outcome was already
+        applied are skipped, so only members that changed while the bot was
+        down are looked up and edited.
+        """
+        # Guilds on other shards are resumed by the process running them
+        guilds = [guild for guild_id in self.storage.load_verifying_guilds()
+                  if (guild := self.bot.get_guild(guild_id)) is not None and
+                  not self.is_verifying(guild_id)]
 
-        return member_dict
+        for source in {self.guild_source(guild.id) for guild in guilds}:
+            await self.restore_source(source)
 
-    def sort_data(self, data):
-        sorted_data = {}
+        for guild in guilds:
+            # Without the member cache, members who left or rejoined while the
+            # bot was down can't be told apart
+            if not self.light_member_cache:
+                if stale_ids := self.applied.prune(guild):
+                    await self.storage.forget_applied_states(guild.id, stale_ids)
 
-        for row in data:
-            # The key is the user's Discord username
-            sorted_data[row[1]] = {
-                "nickname": row[0],
-                "email": row[2]
-            }
+            worker = self.guild_worker(guild.id)
+            worker.start()
+            worker.submit(self.source_usernames(self.guild_source(guild.id)))
 
-        return sorted_data
+            self.logger.info("Resuming Google Sheets verification in guild %s", guild.id)
 
-    def ignore_member(self, member, guild_id):
-        self.check_guild_data_exists(guild_id)
-        guild_ignores = self.guild_data[guild_id]["ignores"]
+    def guild_worker(self, guild_id: int):
+        if (worker := self.workers.get(guild_id)) is None:
+            worker = GuildWorker(guild_id, self.verify_guild, self.logger)
+            self.workers[guild_id] = worker
 
-        # Check if the user has any ignored roles
-        for role in member.roles:
-            if role.id in guild_ignores["roles"]:
-                return True
+        return worker
 
-        # Check if the specific user is supposed to be ignored
-        if member.id in guild_ignores["users"]:
-            return True
+    async def forget_applied(self, guild_id: int, member_ids):
+        """
+        Forgets what verification applied to members, so they are looked up
+        and verified again the next time they come up.
+        """
+        if forgotten := [member_id for member_id in member_ids
+                         if self.applied.forget(guild_id, member_id)]:
+            await self.storage.forget_applied_states(guild_id, forgotten)
+
+    async def fetch_with_breakers(self, client: sheets.SheetsClient, cursors):
+        """
+        Works like `sheets.fetch_cursors`, but fetches every spreadsheet
+        through its circuit breaker and retries transient errors.
+
+        Spreadsheets that can't be fetched are left out of the results.
+        """
+        spreadsheet_cursors = {}
+
+        for cursor in cursors:
+            spreadsheet_cursors.setdefault(cursor.source.spreadsheet_id, []).append(cursor)
+
+        fetched = {}
+
+        for results in await asyncio.gather(*(
+                self.fetch_spreadsheet(client, spreadsheet_id, spreadsheet_cursors)
+                for spreadsheet_id, spreadsheet_cursors in spreadsheet_cursors.items())):
+            fetched.update(results)
+
+        return fetched
+
+    async def fetch_spreadsheet(self, client: sheets.SheetsClient, spreadsheet_id: str, cursors):
+        breaker = self.breakers.setdefault(
+            spreadsheet_id, CircuitBreaker(spreadsheet_id, self.logger))
+
+        if not breaker.allow():
+            return {}
+
+        # Probes of a failing spreadsheet aren't retried
+        attempts = 1 if breaker.state is BreakerState.HALF_OPEN else circuit_breaker.MAX_ATTEMPTS
+
+        for attempt in range(attempts):
+            try:
+                results = await sheets.fetch_cursors(client, cursors)
+            except Exception as e:
+                error = e
+
+                if attempt + 1 == attempts or not circuit_breaker.is_transient(e):
+                    break
+
+                delay = circuit_breaker.backoff_delay(attempt)
+                self.logger.warning("Retrying spreadsheet %s in %.1f seconds: %s",
+                                    spreadsheet_id, delay, e)
+                self.metrics.increment("fetch_retries")
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return results
+
+        # A single range that doesn't exist fails the whole batch, so the
+        # ranges are fetched one at a time to keep the other guilds going
+        if circuit_breaker.is_bad_request(error) and len(cursors) > 1:
+            return await self.fetch_ranges_separately(client, spreadsheet_id, cursors, error)
+
+        self.logger.error("Failed to fetch spreadsheet %s: %s", spreadsheet_id, error)
+        self.metrics.increment("errors")
+
+        if breaker.record_failure(error):
+            self.metrics.increment("breaker_opens")
+
+        return {}
+
+    async def fetch_ranges_separately(self, client: sheets.SheetsClient, spreadsheet_id: str,
+                                      cursors, error: Exception):
+        """
+        Fetches each cursor of a spreadsheet with a request of its own after
+        fetching them together failed with `error`. Cursors that still fail
+        are left out.
+        """
+        breaker = self.breakers[spreadsheet_id]
+        results = {}
+
+        for cursor in cursors:
+            try:
+                results.update(await sheets.fetch_cursors(client, [cursor]))
+            except Exception as e:
+                self.logger.error("Failed to fetch %s: %s", cursor.source, e)
+                self.metrics.increment("errors")
+
+        # The spreadsheet itself is fine as long as some of its ranges are
+        if results:
+            breaker.record_success()
+        elif breaker.record_failure(error):
+            self.metrics.increment("breaker_opens")
+
+        return results
+
+    async def verify_guild(self, guild_id: int, usernames, deadline: float):
+        """
+        Verifies the form respondents with the given usernames in a guild.
+
+        Returns the usernames that weren't reached before the deadline.
+        """
+        current_guild_data = self.guild_data.get(guild_id, {})
+
+        # Get a reference to the current guild
+        if (current_guild := self.bot.get_guild(guild_id)) is None:
+            raise GuildConfigError("the bot is no longer in this guild")
+
+        # Check if the guild has a verified role
+        if (verified_role_id := current_guild_data.get("verified_role")) is None:
+            raise GuildConfigError("no verified role is set")
+
+        # Get the verified role reference through the guild
+        if (verified_role := current_guild.get_role(verified_role_id)) is None:
+            raise GuildConfigError("the verified role no longer exists")
+
+        # Ignores are only looked up once per guild each pass
+        ignores = self.guild_ignores(guild_id)
+
+        source = self.guild_source(guild_id)
+        source_data = self.sheets_data.get(source, {})
+
+        # Edits are scheduled in the background lane and awaited together.
+        # Member -> (username, future of the edit)
+        pending_edits = {}
+        # Members whose outcome is applied once their edits (if any) succeed
+        applied_usernames = {}
+        usernames = list(usernames)
+        leftover = set()
+        resolve_seconds = 0.0
+        skipped = 0
+
+        # Edits beyond what the guild's rate budget lets through before the
+        # deadline would only keep this pass running past it
+        edit_limit = self.scheduler.background_capacity(guild_id, deadline - time.monotonic())
+
+        # Iterate over people who have filled out Google Form, looking up a
+        # batch of them in the guild at a time
+        for idx in range(0, len(usernames), RESOLVE_BATCH):
+            if time.monotonic() > deadline or len(pending_edits) >= edit_limit:
+                leftover = set(usernames[idx:])
+                break
+
+            # Responses can disappear when the whole sheet is re-read
+            batch = [username for username in usernames[idx:idx + RESOLVE_BATCH]
+                     if username in source_data]
+
+            # Without the member cache, looking respondents up is expensive, so
+            # those whose outcome was applied since the bot started are skipped
+            # without it. Older states can't be trusted, since members may have
+            # left, rejoined or changed usernames while the bot was down.
+            if self.light_member_cache:
+                unchanged = {username for username in batch
+                             if self.already_applied(guild_id, username, source,
+                                                     current_guild_data, verified_role,
+                                                     since=self.started_at)}
+
+                if unchanged:
+                    skipped += len(unchanged)
+                    batch = [username for username in batch if username not in unchanged]
+
+            # Only users that actually exist in the guild are returned
+            resolve_start = time.perf_counter()
+            members = await self.member_index.resolve(current_guild, batch)
+            resolve_seconds += time.perf_counter() - resolve_start
+
+            for username, update_member in members.items():
+                # Ignored members are left alone, and don't have anything
+                # applied to them
+                if self.ignore_member(update_member, guild_id, ignores):
+                    continue
+
+                # Resolved members are always compared with what they should
+                # be, so that nicknames and roles changed by hand since the
+                # outcome was applied are corrected
+                changes = self.member_changes(update_member, username, source,
+                                              current_guild_data, verified_role)
+
+                # Respondents without a valid school email have nothing applied
+                if changes is None:
+                    continue
+
+                if changes:
+                    pending_edits[update_member] = (username, self.schedule(
+                        guild_id, "member_edit", update_member.edit,
+                        priority=Priority.LOW, **changes))
+
+                applied_usernames[update_member] = username
+
+        self.metrics.record("member_index", resolve_seconds)
+        self.metrics.increment("members_skipped", skipped)
+
+        # Edits still queued at the deadline are dropped and carried over to
+        # the next pass
+        with self.metrics.time("discord_write"):
+            if pending_edits:
+                await asyncio.wait([future for _, future in pending_edits.values()],
+                                   timeout=max(deadline - time.monotonic(), 0))
+
+        for member, (username, future) in pending_edits.items():
+            if not future.done():
+                future.cancel()
+                leftover.add(username)
+                applied_usernames.pop(member, None)
+            elif (error := future.exception()) is not None:
+                self.logger.error("Failed to verify %s: %s",
+                                  member.name, error)
+                self.metrics.increment("errors")
+                applied_usernames.pop(member, None)
+            else:
+                self.metrics.increment("members_changed")
+
+        if applied_usernames:
+            now = time.time()
+            await self.storage.store_applied_states([
+                self.applied.record(
+                    guild_id, username, member.id,
+                    self.outcome_digest(username, source, member.id, current_guild_data,
+                                        verified_role),
+                    now)
+                for member, username in applied_usernames.items()])
+
+        return leftover
+
+    def outcome_digest(self, username: str, source: sheets.SheetSource, member_id: int,
+                       guild_data: dict, verified_role: discord.Role):
+        """
+        Hashes the outcome of verifying a form respondent in a guild.
+        """
+        nickname = self.desired_nickname(username, source, member_id, guild_data)
+        return outcome_digest(nickname, verified_role.id)
+
+    def already_applied(self, guild_id: int, username: str, source: sheets.SheetSource,
+                        guild_data: dict, verified_role: discord.Role, since=None):
+        """
+        Checks whether the outcome of verifying a form respondent is the same
+        as when it was last applied, i.e. neither their response nor the
+        guild's settings for them have changed since.
+
+        If given, the outcome also has to have been applied at or after
+        `since`.
+        """
+        if (state := self.applied.get(guild_id, username)) is None:
+            return False
+
+        if since is not None and state.applied_at < since:
+            return False
+
+        return state.digest == self.outcome_digest(username, source, state.member_id,
+                                                   guild_data, verified_role)
+
+    def guild_source(self, guild_id: int):
+        """
+        Returns the sheet source a guild reads its form responses from.
+        """
+        if (source := self.guild_data.get(guild_id, {}).get("sheet_source")) is None:
+            return sheets.config.default_source
+
+        return sheets.SheetSource(*source)
+
+    def source_usernames(self, source: sheets.SheetSource):
+        """
+        Returns the usernames in the last fetched snapshot of a sheet source.
+        """
+        if (source_snapshot := self.sheets_data.get(source)) is None:
+            return ()
+
+        return source_snapshot.usernames()
+
+    def is_verifying(self, guild_id: int):
+        return (worker := self.workers.get(guild_id)) is not None and worker.running
+
+    def any_verifying(self):
+        return any(worker.running for worker in self.workers.values())
 
-        return False
+    async def verify_new_member(self, member: discord.Member):
+        """
+        Verifies a member right away if they are in the last fetched snapshot
+        of the sheet.
+        """
+        if changes := self.join_changes(member):
+            # Joins can come in bursts (e.g. raids), so they are rate limited
+            # like the rest of the background verification
+            try:
+                await self.schedule(member.guild.id, "member_edit", member.edit,
+                                    priority=Priority.LOW, **changes)
+            except discord.HTTPException as e:
+                self.logger.error("Failed to verify %s: %s", member.name, e)
 
-    def extract_username(self, school_email: str):
+    def join_changes(self, member: discord.Member):
         """
-        Extracts someone's school username from their email.
+        Returns the `member.edit` arguments that verify a joining member from
+        the last fetched snapshot, which are empty if they can't be verified
+        right away (e.g. because they are ignored or have no valid school
+        email).
         """
-        return re.search(r"^(\D+)\d+", school_email)
+        if not self.is_respondent(member):
+            return {}
+
+        guild_data = self.guild_data[member.guild.id]
 
-    def nickname_valid(self, discord_name: str):
-        user_email = self.sheets_data[discord_name]["email"]
-        test_nick = self.sheets_data[discord_name]["nickname"].lower()
+        # The verified role may have been deleted since it was set
+        if (verified_role := member.guild.get_role(guild_data["verified_role"])) is None:
+            return {}
 
-        # Get the non-number part of the user's school username
-        user_username = self.extract_username(user_email)
+        if self.ignore_member(member, member.guild.id):
+            return {}
 
-        if user_username is None:
+        return self.member_changes(member, full_username(member),
+                                   self.guild_source(member.guild.id), guild_data,
+                                   verified_role) or {}
+
+    def is_respondent(self, member: discord.Member):
+        """
+        Checks whether a member filled out the form and can be verified in
+        their guild.
+        """
+        guild_data = self.guild_data.get(member.guild.id)
+
+        if guild_data is None or guild_data.get("verified_role") is None:
             return False
 
-        user_name_fragment = user_username.group(1)
-        user_first_initial = user_name_fragment[-1]
-        user_last_initial = user_name_fragment[0]
-        user_last_name_fragment = user_name_fragment[1:-1]
+        source_data = self.sheets_data.get(self.guild_source(member.guild.id), {})
 
-        # Regex for matching against the test nickname
-        first_initial = fr"^{user_first_initial}"
-        last_initial = fr"{user_last_initial}({user_last_name_fragment})?\.?"
+        return full_username(member) in source_data
 
-        # Check if the first initial matches
-        if re.search(first_initial, test_nick):
-            # Check if the user supplied a last initial/name
-            if re.search(last_initial, test_nick):
-                return True
+    def member_changes(self, member: discord.Member, username: str, source: sheets.SheetSource,
+                       guild_data: dict, verified_role: discord.Role):
+        """
+        Returns the `member.edit` arguments needed to verify a form respondent,
+        which are empty if they are already verified, or None if they can't be
+        verified.
+
+        Callers check whether the member is ignored first.
+        """
+        new_nick = self.desired_nickname(username, source, member.id, guild_data)
 
-        return False
+        # Responses without a valid school email can't be verified
+        if new_nick is None:
+            return None
+
+        # Only members whose nickname or roles are wrong are edited
+        return reconcile.desired_changes(member, new_nick, verified_role)
+
+    def schedule(self, guild_id: int, route: str, action, *args,
+                 priority=Priority.HIGH, **kwargs):
+        """
+        Schedules a Discord action (e.g. `member.edit`) with the given
+        arguments and returns a future for its result.
+        """
+        return self.scheduler.submit(
+            guild_id, route, functools.partial(action, *args, **kwargs), priority)
+
+    def desired_nickname(self, username: str, source: sheets.SheetSource, member_id: int,
+                         guild_data: dict):
+        """
+        Returns the nickname a form respondent should have in a guild, or None
+        if their response has no valid school email.
+        """
+        # Check if the user's nickname has been overridden
+        if member_id in (overrides := guild_data["overrides"]).keys():
+            return overrides[member_id]
+
+        response = self.sheets_data[source].get(username)
+
+        # This is the name that they put into the Google Form
+        if response.validated.nickname_valid:
+            return response.nickname
+
+        return response.validated.school_username
+
+    def guild_ignores(self, guild_id):
+        """
+        Returns frozen copies of a guild's ignored role and user ids.
+        """
+        self.check_guild_data_exists(guild_id)
+        guild_ignores = self.guild_data[guild_id]["ignores"]
+
+        return frozenset(guild_ignores["roles"]), frozenset(guild_ignores["users"])
+
+    def ignore_member(self, member, guild_id, ignores=None):
+        """
+        Checks whether a member is ignored for verification, either directly or
+        through one of their roles.
+
+        `ignores` can be the result of a previous `guild_ignores` call so that it
+        isn't recomputed for every member.
+        """
+        ignored_roles, ignored_users = ignores or self.guild_ignores(guild_id)
+
+        # Check if the specific user is supposed to be ignored
+        if member.id in ignored_users:
+            return True
+
+        # Check if the user has any ignored roles
+        return not ignored_roles.isdisjoint(role.id for role in member.roles)
 
     @commands.group()
     @commands.bot_has_guild_permissions(manage_nicknames=True, manage_roles=True)
@@ -192,9 +794,28 @@ class Verification(commands.Cog):
 
         verified_role = ctx.guild.get_role(verified_role_id)
 
-        self.update_data.start()
-        self.logger.info("Starting Google Sheets verification loop")
-        self.verifying = True
+        if self.is_verifying(current_guild_id):
+            await ctx.send("Verification is already running in this guild.")
+            return
+
+        worker = self.guild_worker(current_guild_id)
+        worker.start()
+        self.logger.info("Starting Google Sheets verification in guild %s",
+                         current_guild_id)
+
+        # Verification resumes in this guild after a restart
+        await self.storage.set_verifying(current_guild_id, True)
+
+        if self.update_data.is_running():
+            # Check everyone from the current snapshot in this guild
+            worker.submit(self.source_usernames(self.guild_source(current_guild_id)))
+        else:
+            # Members may have joined or changed while the loop wasn't running
+            for cursor in self.sheet_cursors.values():
+                cursor.reset()
+
+            self.poller.reset()
+            self.update_data.start()
 
         await ctx.send(f"Starting verification loop.\nVerified role: {verified_role}")
 
@@ -203,15 +824,27 @@ class Verification(commands.Cog):
         """
         Stops the Google Sheets Verification loop.
         """
-        # Stop the verification loop
-        self.update_data.stop()
-
-        self.logger.info("Stopping Google Sheets verification loop.")
-        self.verifying = False
+        # Stop verifying this guild
+        await self.stop_guild(ctx.guild.id)
 
         # Let the user know
         await ctx.send("Stopping verification loop.")
 
+    async def stop_guild(self, guild_id: int):
+        """
+        Stops verification in a guild, and the polling loop along with it if
+        no other guild is being verified.
+        """
+        if (worker := self.workers.get(guild_id)) is not None:
+            worker.stop()
+
+        await self.storage.set_verifying(guild_id, False)
+
+        self.logger.info("Stopping Google Sheets verification in guild %s", guild_id)
+
+        if not self.any_verifying():
+            self.update_data.cancel()
+
     @verify.command(usage="set <role>")
     async def set(self, ctx: commands.context):
         """
@@ -232,7 +865,7 @@ class Verification(commands.Cog):
         if verified_role.id != (current_guild_data := self.guild_data[ctx.guild.id]).get("verified_role"):
             current_guild_data["verified_role"] = verified_role.id
             await ctx.send(f"New verified role for this guild: {verified_role.name}")
-            self.write_guild_data_changes()
+            await self.storage.set_verified_role(ctx.guild.id, verified_role.id)
 
         # Let the user know if the supplied role was the same as the current one
         else:
@@ -257,7 +890,10 @@ class Verification(commands.Cog):
 
         # Remove the role and write changes
         del current_guild_data["verified_role"]
-        self.write_guild_data_changes()
+        await self.storage.unset_verified_role(ctx.guild.id)
+
+        # Guilds can't be verified without a verified role
+        await self.stop_guild(ctx.guild.id)
 
         # Fetch the verified role's name
         verified_role = ctx.guild.get_role(verified_role_id)
@@ -285,6 +921,102 @@ class Verification(commands.Cog):
 
         await ctx.send(message)
 
+    @verify.command(usage="source [spreadsheet id] [range]")
+    async def source(self, ctx: commands.Context, spreadsheet_id=None, *range_name):
+        """
+        Sets the spreadsheet and range this guild's form responses are read from.
+
+        The range is in A1 notation and can contain spaces, e.g.
+        `Form Responses 1!B2:D`. It is read once to check it before it is
+        saved. Without arguments, the current source is shown instead. Using `default` as the spreadsheet id goes back to the sheet
+        from sheetsconfig.yaml.
+        """
+        self.check_guild_data_exists(ctx.guild.id)
+        current_guild_data = self.guild_data[ctx.guild.id]
+
+        if spreadsheet_id is None:
+            source = self.guild_source(ctx.guild.id)
+            await ctx.send(f"Form responses are read from `{source.range_name}` of spreadsheet `{source.spreadsheet_id}`.")
+            return
+
+        if spreadsheet_id == "default":
+            current_guild_data.pop("sheet_source", None)
+            await self.storage.unset_sheet_source(ctx.guild.id)
+        elif len(range_name) == 0:
+            await ctx.send("Please supply a range to read form responses from.")
+            return
+        else:
+            new_source = sheets.SheetSource(spreadsheet_id, " ".join(range_name))
+
+            # A range that can't be read would fail the fetches of every
+            # guild sharing its spreadsheet, so it isn't saved
+            if (problem := await self.check_source(new_source)) is not None:
+                await ctx.send(f"Can't read form responses from `{new_source.range_name}` "
+                               f"of spreadsheet `{new_source.spreadsheet_id}`: {problem}")
+                return
+
+            current_guild_data["sheet_source"] = tuple(new_source)
+            await self.storage.set_sheet_source(ctx.guild.id, *new_source)
+
+        source = self.guild_source(ctx.guild.id)
+
+        # Sources that haven't been polled yet are fully read on the next poll
+        if (worker := self.workers.get(ctx.guild.id)) is not None:
+            worker.submit(self.source_usernames(source))
+
+        await ctx.send(f"Now reading form responses from `{source.range_name}` of spreadsheet `{source.spreadsheet_id}`.")
+
+    async def check_source(self, source: sheets.SheetSource):
+        """
+        Checks that a sheet source can be read by fetching it once. Returns
+        what is wrong with it, or None if nothing is.
+
+        Before the bot has signed into Google, only the range's notation can
+        be checked, so named ranges can't be used until then.
+        """
+        if self.sheets_client is None:
+            if sheets.A1_RANGE_REGEX.match(source.range_name) is None:
+                return "the range isn't in A1 notation (e.g. `Form Responses 1!B2:D`)"
+
+            return None
+
+        try:
+            await self.sheets_client.batch_fetch({source.spreadsheet_id: [source.range_name]})
+        except Exception as e:
+            return getattr(e, "reason", None) or str(e)
+
+        return None
+
+    @verify.command(usage="stats")
+    async def stats(self, ctx: commands.Context):
+        """
+        Shows how long each part of the verification loop takes, along with
+        counts of fetched rows, edited members, API calls and errors, and
+        whether this guild's spreadsheet is currently being fetched.
+        """
+        stats_embed = discord.Embed(title="Verification Statistics",
+                                    color=discord.Color.gold())
+
+        phase_lines = [f"`{phase}`: {timing.last * 1000:.1f} ms last, "
+                       f"{timing.average * 1000:.1f} ms average ({timing.count} runs)"
+                       for phase, timing in self.metrics.phases.items()]
+        counter_lines = [f"`{counter}`: {value:g}"
+                         for counter, value in self.metrics.counters.items()]
+
+        stats_embed.add_field(name="Phases", value="\n".join(phase_lines), inline=False)
+        stats_embed.add_field(name="Counters", value="\n".join(counter_lines), inline=False)
+
+        # A spreadsheet that failed recently is only fetched again after a
+        # while. Only this guild's own spreadsheet is shown, since the others
+        # belong to other guilds.
+        spreadsheet_id = self.guild_source(ctx.guild.id).spreadsheet_id
+
+        if (breaker := self.breakers.get(spreadsheet_id)) is not None:
+            stats_embed.add_field(name="Spreadsheet", value=breaker.status_text()[:1024],
+                                  inline=False)
+
+        await ctx.send(embed=stats_embed)
+
     @verify.error
     async def verify_error(self, ctx: commands.Context, error):
         if isinstance(error, commands.BotMissingPermissions):
@@ -304,9 +1036,6 @@ class Verification(commands.Cog):
         In both cases, ignored users will not be reverified, but you will only
         be told about ignored users in the user case.
         """
-        # Source of the information embed
-        import bot
-
         # Store current guild and its data
         current_guild = ctx.guild
         self.check_guild_data_exists(current_guild.id)
@@ -319,16 +1048,12 @@ class Verification(commands.Cog):
                 return
 
             # Clear the user's nickname and roles
-            await member.edit(nick=None, roles=[])
+            await self.schedule(current_guild.id, "member_edit", member.edit,
+                                nick=None, roles=[])
+            await self.forget_applied(current_guild.id, [member.id])
 
             # DM the user the information embed
-            if member.dm_channel is None:
-                await member.create_dm()
-
-            try:
-                await member.dm_channel.send(embed=utilities.info_embed)
-            except discord.Forbidden as e:
-                self.logger.error(f"Failed to DM user: {member.name}")
+            self.dm_outbox.enqueue(member)
 
             # ! For debug purposes; remove later
             await ctx.send(f"Reverifying {member.name}.")
@@ -340,31 +1065,78 @@ class Verification(commands.Cog):
                 return
 
             reverify_role = role_mentions[0]
-            verified_role = current_guild.get_role(verified_role_id)
 
-            for member in current_guild.members:
-                if reverify_role in member.roles and not self.ignore_member(member, current_guild.id):
-                    # Remove the target role
-                    await member.remove_roles(reverify_role, reason="Reverification")
+            if (current_guild.id, reverify_role.id) in self.reverify_jobs:
+                await ctx.send(f"{reverify_role.name} is already being reverified.")
+                return
+
+            ignores = self.guild_ignores(current_guild.id)
+            role_members = await self.member_index.role_members(current_guild, reverify_role)
+            member_ids = [member.id for member in role_members
+                          if not self.ignore_member(member, current_guild.id, ignores)]
+
+            # The job reports its progress in this channel
+            self.start_reverify_job(ReverifyJob(
+                current_guild, reverify_role, ctx.channel, member_ids, self.storage,
+                self.reverify_role_member, self.member_index.get_member, self.logger))
+
+    def start_reverify_job(self, job: ReverifyJob):
+        self.reverify_jobs[job.key] = job
+        job.start().add_done_callback(
+            lambda task: self.reverify_jobs.pop(job.key, None))
+
+    async def resume_reverify_jobs(self):
+        """
+        Resumes reverify jobs that were interrupted by a restart.
+        """
+        for job_data in self.storage.load_reverify_jobs():
+            if (job_data["guild_id"], job_data["role_id"]) in self.reverify_jobs:
+                continue
+
+            # Guilds on other shards are resumed by the process running them
+            if (guild := self.bot.get_guild(job_data["guild_id"])) is None:
+                continue
+
+            role = guild.get_role(job_data["role_id"])
+            channel = guild.get_channel(job_data["channel_id"])
 
-                    # Remove the verified role
-                    if verified_role in member.roles:
-                        await member.remove_roles(
-                            verified_role, reason="Reverification")
+            # Jobs can't be finished if their role or channel is gone
+            if role is None or channel is None:
+                await self.storage.finish_reverify_job(job_data["guild_id"], job_data["role_id"])
+                continue
 
-                    # Reset the user's nickname
-                    await member.edit(nick=None)
+            try:
+                message = await channel.fetch_message(job_data["message_id"])
+            except discord.HTTPException:
+                message = await channel.send(f"Resuming reverification of {role.name}.")
+
+            self.logger.info("Resuming reverification of %s in guild %s",
+                             role.name, guild.id)
 
-                    # DM the user the information embed
-                    if member.dm_channel is None:
-                        await member.create_dm()
+            self.start_reverify_job(ReverifyJob(
+                guild, role, channel, job_data["member_ids"], self.storage,
+                self.reverify_role_member, self.member_index.get_member, self.logger,
+                total=job_data["total"], failed=job_data["failed"],
+                message=message))
 
-                    try:
-                        await member.dm_channel.send(embed=utilities.info_embed)
-                    except discord.Forbidden as e:
-                        self.logger.error(f"Cannot DM {member.name}")
+    async def reverify_role_member(self, member: discord.Member, reverify_role: discord.Role):
+        """
+        Removes a member's reverified and verified roles and resets their
+        nickname with a single edit, then DMs them the information embed.
+        """
+        verified_role_id = self.guild_data.get(member.guild.id, {}).get("verified_role")
+        remaining_roles = [role for role in member.roles[1:]
+                           if role != reverify_role and role.id != verified_role_id]
 
-            await ctx.send(f"Done reverifying {reverify_role.name}.")
+        # Bulk reverification has a lane of its own, which leaves room for
+        # commands without being held to the verification loop's budget
+        await self.schedule(member.guild.id, "member_edit", member.edit,
+                            priority=Priority.BULK, nick=None, roles=remaining_roles,
+                            reason="Reverification")
+        await self.forget_applied(member.guild.id, [member.id])
+
+        # DM the user the information embed
+        self.dm_outbox.enqueue(member)
 
     @reverify.error
     async def reverify_error(self, ctx: commands.Context, error):
@@ -399,18 +1171,16 @@ class Verification(commands.Cog):
         # Store reference to ignored_ids subsection of guild data
         ignores = self.guild_data[ctx.guild.id]["ignores"]
 
-        # Add users mentioned to ignore_rules under the "users" key
-        for member in ctx.message.mentions:
-            if member.id not in ignores["users"]:
-                ignores["users"].append(member.id)
+        new_user_ids = {member.id for member in ctx.message.mentions} - ignores["users"]
+        new_role_ids = {role.id for role in ctx.message.role_mentions} - ignores["roles"]
 
-        # Add roles mentioned to same dictionary under the "roles" key
-        for role in ctx.message.role_mentions:
-            if role.id not in ignores["roles"]:
-                ignores["roles"].append(role.id)
+        # Write ignore changes before applying them
+        await self.storage.add_ignores(
+            guild_id, roles=new_role_ids, users=new_user_ids)
 
-        # Write ignore changes
-        self.write_guild_data_changes()
+        ignores["users"] |= new_user_ids
+        ignores["roles"] |= new_role_ids
+        self.list_pages.invalidate("ignores", guild_id)
 
         response = ""
 
@@ -440,29 +1210,29 @@ class Verification(commands.Cog):
         # Fetch the role and user ignores
         ignores = current_guild_data["ignores"]
 
-        if len(role_mentions := ctx.message.role_mentions) == 0 and len(user_mentions := ctx.message.mentions) == 0:
+        role_mentions = ctx.message.role_mentions
+        user_mentions = ctx.message.mentions
+
+        if len(role_mentions) == 0 and len(user_mentions) == 0:
             await ctx.send("Please provide a user/role to unignore.")
             return
 
-        # List to keep track of role ignores that were removed
-        removed_roles = []
+        # Only ids that are actually ignored can be removed
+        removed_role_ids = ignores["roles"] & {role.id for role in role_mentions}
+        removed_user_ids = ignores["users"] & {user.id for user in user_mentions}
 
-        # Check which roles to remove, if any
-        for role_id in ignores["roles"]:
-            ignore_role = ctx.guild.get_role(role_id)
-            if ignore_role in role_mentions:
-                ignores["roles"].remove(role_id)
-                removed_roles.append(ignore_role.mention)
+        # Write ignore changes before applying them
+        await self.storage.remove_ignores(
+            ctx.guild.id, roles=removed_role_ids, users=removed_user_ids)
 
-        # List to keep track of user ignores that were removed
-        removed_users = []
+        ignores["roles"] -= removed_role_ids
+        ignores["users"] -= removed_user_ids
+        self.list_pages.invalidate("ignores", ctx.guild.id)
 
-        # Check which roles to remove, if any
-        for user_id in ignores["users"]:
-            ignore_member = ctx.guild.get_member(user_id)
-            if ignore_member in user_mentions:
-                ignores["users"].remove(user_id)
-                removed_users.append(ignore_member.mention)
+        removed_roles = [role.mention for role in role_mentions
+                         if role.id in removed_role_ids]
+        removed_users = [user.mention for user in user_mentions
+                         if user.id in removed_user_ids]
 
         # Make an embed saying which roles and users were unignored
         removed_embed = discord.Embed(title="Removed Ignores",
@@ -482,49 +1252,36 @@ class Verification(commands.Cog):
         await ctx.send(embed=removed_embed)
 
     # Named list_ because of naming conflicts with list keyword
-    @ignore.command(name="list", usage="list")
-    async def list_(self, ctx):
+    @ignore.command(name="list", usage="list [page]")
+    async def list_(self, ctx, page: int = 1):
         """
         Lists all ignored roles and users for the current guild.
 
         Users and roles will be displayed in separate categories, which will be
-        omitted in case they don't exist.
+        omitted in case they don't exist. Long lists are split into pages.
         """
 
         # Get reference to guild's ignored ids
         self.check_guild_data_exists(ctx.guild.id)
         ignores = self.guild_data[ctx.guild.id]["ignores"]
 
-        ignore_embed = discord.Embed(title="Ignored Users and Roles",
-                                     color=discord.Color.orange())
+        def render():
+            lines = []
 
-        ignored_roles = []
-        for role_id in ignores["roles"]:
-            role = ctx.guild.get_role(role_id)
-            ignored_roles.append(role.mention)
+            if ignores["roles"]:
+                lines.append("**Ignored Roles:**")
+                lines += [role_mention(role_id) for role_id in sorted(ignores["roles"])]
 
-        ignored_users = []
-        for user_id in ignores["users"]:
-            user = ctx.guild.get_member(user_id)
-            ignored_users.append(user.mention)
+            if ignores["users"]:
+                lines.append("**Ignored Users:**")
+                lines += [user_mention(user_id) for user_id in sorted(ignores["users"])]
 
-        # Add corresponding fields to embed with pretty-printed information
-        if len(ignored_roles) > 0:
-            role_list_str = utilities.pretty_print_list(ignored_roles)
-            ignore_embed.add_field(name="Ignored Roles:",
-                                   value=role_list_str, inline=False)
+            return lines
 
-        if len(ignored_users) > 0:
-            user_list_str = utilities.pretty_print_list(ignored_users)
-            ignore_embed.add_field(name="Ignored Users:",
-                                   value=user_list_str, inline=False)
+        pages = self.list_pages.get("ignores", ctx.guild.id, render)
 
-        # If both lists are empty, let the user know
-        if len(ignored_roles) == 0 and len(ignored_users) == 0:
-            ignore_embed.description = "There are no ignores for this guild."
-
-        # send the embed
-        await ctx.send(embed=ignore_embed)
+        await ctx.send(embed=page_embed("Ignored Users and Roles", discord.Color.orange(),
+                                        pages, page, "There are no ignores for this guild."))
 
     @commands.group()
     @commands.bot_has_guild_permissions(manage_nicknames=True)
@@ -551,7 +1308,8 @@ class Verification(commands.Cog):
         new_nickname = " ".join(name)
 
         # Change the user's nickname
-        await override_user.edit(nick=new_nickname)
+        await self.schedule(ctx.guild.id, "member_edit", override_user.edit,
+                            nick=new_nickname)
 
         # Send a message about the override
         await ctx.send(f"{override_user.name}'s nickname is now overridden to {new_nickname}.")
@@ -560,8 +1318,9 @@ class Verification(commands.Cog):
         self.check_guild_data_exists(ctx.guild.id)
 
         self.guild_data[ctx.guild.id]["overrides"][override_user.id] = new_nickname
+        self.list_pages.invalidate("overrides", ctx.guild.id)
 
-        self.write_guild_data_changes()
+        await self.storage.set_override(ctx.guild.id, override_user.id, new_nickname)
 
     @override.command(usage="remove <user>")
     async def remove(self, ctx: commands.Context):
@@ -582,31 +1341,31 @@ class Verification(commands.Cog):
 
         # Remove the override and write changes
         del current_guild_overrides[override_user.id]
-        await override_user.edit(nick=None)
-        self.write_guild_data_changes()
+        self.list_pages.invalidate("overrides", ctx.guild.id)
+        await self.schedule(ctx.guild.id, "member_edit", override_user.edit,
+                            nick=None)
+        await self.storage.remove_override(ctx.guild.id, override_user.id)
 
         await ctx.send(f"{override_user.name}'s nickname is no longer overridden.")
 
-    @override.command(usage="list")
-    async def list(self, ctx: commands.Context):
+    @override.command(usage="list [page]")
+    async def list(self, ctx: commands.Context, page: int = 1):
         """
         Lists all nickname overrides in the current server.
+
+        Long lists are split into pages.
         """
+        self.check_guild_data_exists(ctx.guild.id)
         overrides = self.guild_data[ctx.guild.id]["overrides"]
 
-        list_embed = discord.Embed(title="Nickname Overrides",
-                                   description="",
-                                   color=discord.Color.green())
-
-        for user_id in overrides.keys():
-            user = ctx.guild.get_member(user_id)
-            list_embed.description += f"{user.mention} ➡️ {overrides[user_id]}\n"
+        def render():
+            return [f"{user_mention(user_id)} ➡️ {nickname}"
+                    for user_id, nickname in overrides.items()]
 
-        # Let user know if there are no overrides
-        if len(overrides.keys()) == 0:
-            list_embed.description = "There are no nickname overrides for this server."
+        pages = self.list_pages.get("overrides", ctx.guild.id, render)
 
-        await ctx.send(embed=list_embed)
+        await ctx.send(embed=page_embed("Nickname Overrides", discord.Color.green(), pages,
+                                        page, "There are no nickname overrides for this server."))
 
     @override.error
     async def override_error(self, ctx: commands.Context, error):
@@ -618,25 +1377,6 @@ class Verification(commands.Cog):
 
             await ctx.send(final_message)
 
-    def read_pickle_if_exists(self, filename, default_val):
-        if os.path.exists(filename):
-            with open(filename, "rb") as data_file:
-                return pickle.load(data_file)
-        else:
-            return default_val
-
-    def write_guild_data_changes(self):
-        with open("guild_data.pickle", "wb") as guild_file:
-            pickle.dump(self.guild_data, guild_file)
-
     def check_guild_data_exists(self, guild_id: discord.Guild.id):
         if self.guild_data.get(guild_id) is None:
-            # Note that verified_role is not initialized as a value, as it can
-            # be set later
-            self.guild_data[guild_id] = {
-                "overrides": {},
-                "ignores": {
-                    "roles": [],
-                    "users": []
-                }
-            }
+            self.guild_data[guild_id] = empty_guild_data()
@@ -0,0 +1,94 @@
+import sys
+
+# Position of each field within the fetched range, counting from 0
+DEFAULT_COLUMNS = {"nickname": 0, "username": 1, "email": 2}
+
+
+class Response:
+    """
+    A single form response.
+
+    Snapshots of large forms hold a lot of these, so they use slots instead
+    of a dictionary per response.
+    """
+    __slots__ = ("username", "nickname", "email", "validated")
+
+    def __init__(self, username: str, nickname: str, email: str):
+        # The respondent's full Discord username (name#discriminator)
+        self.username = username
+        self.nickname = nickname
+        self.email = email
+        # Set by `nickname_validation.validate_responses`
+        self.validated = None
+
+
+def parse_rows(rows, columns: dict):
+    """
+    Turns the rows fetched from a sheet into responses, using the positions
+    in `columns` (see `DEFAULT_COLUMNS`).
+
+    Rows that are too short or don't have a username (e.g. rows edited by
+    hand) are skipped. Returns the responses and the number of rows skipped.
+    """
+    nickname_col = columns["nickname"]
+    username_col = columns["username"]
+    email_col = columns["email"]
+    width = max(nickname_col, username_col, email_col) + 1
+
+    responses = []
+    skipped = 0
+
+    for row in rows:
+        if len(row) < width or not row[username_col]:
+            skipped += 1
+            continue
+
+        # Usernames are also kept by the member index, and the same nicknames
+        # come up again and again
+        responses.append(Response(sys.intern(row[username_col]),
+                                  sys.intern(row[nickname_col]),
+                                  row[email_col]))
+
+    return responses, skipped
+
+
+class SheetSnapshot:
+    """
+    The form responses read from one sheet source.
+
+    Responses are kept in row order, with an index of Discord usernames to
+    their position. A later response from the same username replaces the
+    earlier one.
+    """
+
+    def __init__(self, responses=()):
+        self.responses = []
+        self.index = {}
+
+        self.extend(responses)
+
+    def extend(self, responses):
+        for response in responses:
+            if (position := self.index.get(response.username)) is not None:
+                self.responses[position] = response
+            else:
+                self.index[response.username] = len(self.responses)
+                self.responses.append(response)
+
+    def get(self, username: str):
+        """
+        Returns the response of a username, or None if they didn't respond.
+        """
+        if (position := self.index.get(username)) is None:
+            return None
+
+        return self.responses[position]
+
+    def usernames(self):
+        return self.index.keys()
+
+    def __contains__(self, username: str):
+        return username in self.index
+
+    def __len__(self):
+        return len(self.responses)
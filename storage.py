@@ -0,0 +1,547 @@
+import asyncio
+import json
+import os
+import pickle
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE_FILE = "authbot.db"
+
+# Seconds to wait for another process sharing the database to finish writing
+BUSY_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verified_roles (
+    guild_id INTEGER PRIMARY KEY,
+    role_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ignores (
+    guild_id INTEGER NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('roles', 'users')),
+    target_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, kind, target_id)
+);
+
+CREATE TABLE IF NOT EXISTS overrides (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    nickname TEXT NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS modroles (
+    guild_id INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, role_id)
+);
+
+CREATE TABLE IF NOT EXISTS sheet_sources (
+    guild_id INTEGER PRIMARY KEY,
+    spreadsheet_id TEXT NOT NULL,
+    range_name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS reverify_jobs (
+    guild_id INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, role_id)
+);
+
+CREATE TABLE IF NOT EXISTS reverify_members (
+    guild_id INTEGER NOT NULL,
+    role_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, role_id, member_id)
+);
+
+CREATE TABLE IF NOT EXISTS dm_blocked (
+    user_id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS sheet_fetches (
+    spreadsheet_id TEXT NOT NULL,
+    range_name TEXT NOT NULL,
+    generation INTEGER NOT NULL DEFAULT 0,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    cycles_since_resync INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL NOT NULL DEFAULT 0,
+    leader TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (spreadsheet_id, range_name)
+);
+
+CREATE TABLE IF NOT EXISTS sheet_rows (
+    spreadsheet_id TEXT NOT NULL,
+    range_name TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    row_values TEXT NOT NULL,
+    PRIMARY KEY (spreadsheet_id, range_name, row_index)
+);
+
+CREATE TABLE IF NOT EXISTS verifying_guilds (
+    guild_id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS applied_states (
+    guild_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    member_id INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    applied_at REAL NOT NULL,
+    PRIMARY KEY (guild_id, username)
+);
+
+CREATE INDEX IF NOT EXISTS applied_states_member ON applied_states (guild_id, member_id);
+
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY
+);
+"""
+
+
+def empty_guild_data():
+    # Note that verified_role is not initialized as a value, as it can be set
+    # later
+    return {
+        "overrides": {},
+        "ignores": {
+            "roles": set(),
+            "users": set()
+        }
+    }
+
+
+class Storage:
+    """
+    Persistent storage for guild data and modroles, backed by SQLite.
+
+    Every change is written as its own small transaction on a dedicated worker
+    thread, so coroutines never block on disk writes. The database runs in WAL
+    mode, so a crash can't leave it half written, and several bot processes
+    (shards) on the same host can share it.
+    """
+
+    def __init__(self, path=DATABASE_FILE):
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+        # sqlite3 connections can't be used from several threads at once
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="storage")
+
+        self.migrate_pickles()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.connection.close()
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def write(self, statement: str, rows):
+        """
+        Runs a statement for every row in a single transaction.
+        """
+        with self.connection:
+            self.connection.executemany(statement, rows)
+
+    def write_all(self, writes):
+        """
+        Runs several (statement, rows) pairs in a single transaction.
+        """
+        with self.connection:
+            for statement, rows in writes:
+                self.connection.executemany(statement, rows)
+
+    # Loading (only done at startup, so these block)
+
+    def load_guild_data(self):
+        guild_data = {}
+
+        def guild(guild_id):
+            return guild_data.setdefault(guild_id, empty_guild_data())
+
+        for guild_id, role_id in self.connection.execute(
+                "SELECT guild_id, role_id FROM verified_roles"):
+            guild(guild_id)["verified_role"] = role_id
+
+        for guild_id, kind, target_id in self.connection.execute(
+                "SELECT guild_id, kind, target_id FROM ignores"):
+            guild(guild_id)["ignores"][kind].add(target_id)
+
+        for guild_id, user_id, nickname in self.connection.execute(
+                "SELECT guild_id, user_id, nickname FROM overrides"):
+            guild(guild_id)["overrides"][user_id] = nickname
+
+        for guild_id, spreadsheet_id, range_name in self.connection.execute(
+                "SELECT guild_id, spreadsheet_id, range_name FROM sheet_sources"):
+            guild(guild_id)["sheet_source"] = (spreadsheet_id, range_name)
+
+        return guild_data
+
+    def load_modroles(self):
+        modroles = {}
+
+        for guild_id, role_id in self.connection.execute(
+                "SELECT guild_id, role_id FROM modroles"):
+            modroles.setdefault(guild_id, []).append(role_id)
+
+        return modroles
+
+    # Verified roles
+
+    async def set_verified_role(self, guild_id: int, role_id: int):
+        await self.run(self.write, """
+            INSERT INTO verified_roles (guild_id, role_id) VALUES (?, ?)
+            ON CONFLICT (guild_id) DO UPDATE SET role_id = excluded.role_id
+        """, [(guild_id, role_id)])
+
+    async def unset_verified_role(self, guild_id: int):
+        await self.run(self.write, "DELETE FROM verified_roles WHERE guild_id = ?",
+                       [(guild_id,)])
+
+    # Sheet sources
+
+    async def set_sheet_source(self, guild_id: int, spreadsheet_id: str, range_name: str):
+        await self.run(self.write, """
+            INSERT INTO sheet_sources (guild_id, spreadsheet_id, range_name)
+            VALUES (?, ?, ?)
+            ON CONFLICT (guild_id) DO UPDATE SET
+                spreadsheet_id = excluded.spreadsheet_id,
+                range_name = excluded.range_name
+        """, [(guild_id, spreadsheet_id, range_name)])
+
+    async def unset_sheet_source(self, guild_id: int):
+        await self.run(self.write, "DELETE FROM sheet_sources WHERE guild_id = ?",
+                       [(guild_id,)])
+
+    # Ignores
+
+    @staticmethod
+    def ignore_rows(guild_id: int, roles, users):
+        return ([(guild_id, "roles", role_id) for role_id in roles] +
+                [(guild_id, "users", user_id) for user_id in users])
+
+    async def add_ignores(self, guild_id: int, roles=(), users=()):
+        """
+        Ignores roles and users in a single transaction.
+        """
+        await self.run(self.write, """
+            INSERT OR IGNORE INTO ignores (guild_id, kind, target_id)
+            VALUES (?, ?, ?)
+        """, self.ignore_rows(guild_id, roles, users))
+
+    async def remove_ignores(self, guild_id: int, roles=(), users=()):
+        """
+        Unignores roles and users in a single transaction.
+        """
+        await self.run(self.write, """
+            DELETE FROM ignores WHERE guild_id = ? AND kind = ? AND target_id = ?
+        """, self.ignore_rows(guild_id, roles, users))
+
+    # Nickname overrides
+
+    async def set_override(self, guild_id: int, user_id: int, nickname: str):
+        await self.run(self.write, """
+            INSERT INTO overrides (guild_id, user_id, nickname) VALUES (?, ?, ?)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET nickname = excluded.nickname
+        """, [(guild_id, user_id, nickname)])
+
+    async def remove_override(self, guild_id: int, user_id: int):
+        await self.run(self.write,
+                       "DELETE FROM overrides WHERE guild_id = ? AND user_id = ?",
+                       [(guild_id, user_id)])
+
+    # Modroles
+
+    async def add_modroles(self, guild_id: int, role_ids):
+        await self.run(self.write,
+                       "INSERT OR IGNORE INTO modroles (guild_id, role_id) VALUES (?, ?)",
+                       [(guild_id, role_id) for role_id in role_ids])
+
+    async def remove_modroles(self, guild_id: int, role_ids):
+        await self.run(self.write,
+                       "DELETE FROM modroles WHERE guild_id = ? AND role_id = ?",
+                       [(guild_id, role_id) for role_id in role_ids])
+
+    # Reverify jobs
+
+    def load_reverify_jobs(self):
+        """
+        Returns every unfinished reverify job as a dictionary, including the
+        ids of the members it still has to reverify.
+        """
+        jobs = []
+
+        for guild_id, role_id, channel_id, message_id, total, done, failed in self.connection.execute(
+                "SELECT guild_id, role_id, channel_id, message_id, total, done, failed FROM reverify_jobs"):
+            member_ids = [row[0] for row in self.connection.execute(
+                "SELECT member_id FROM reverify_members WHERE guild_id = ? AND role_id = ?",
+                (guild_id, role_id))]
+
+            jobs.append({
+                "guild_id": guild_id,
+                "role_id": role_id,
+                "channel_id": channel_id,
+                "message_id": message_id,
+                "total": total,
+                "done": done,
+                "failed": failed,
+                "member_ids": member_ids
+            })
+
+        return jobs
+
+    async def create_reverify_job(self, guild_id: int, role_id: int, channel_id: int,
+                                  message_id: int, total: int, member_ids):
+        await self.run(self.write_all, [
+            ("""
+                INSERT OR REPLACE INTO reverify_jobs
+                (guild_id, role_id, channel_id, message_id, total)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(guild_id, role_id, channel_id, message_id, total)]),
+            ("INSERT OR IGNORE INTO reverify_members VALUES (?, ?, ?)",
+             [(guild_id, role_id, member_id) for member_id in member_ids])
+        ])
+
+    async def checkpoint_reverify_job(self, guild_id: int, role_id: int,
+                                      finished_ids, done: int, failed: int):
+        await self.run(self.write_all, [
+            ("UPDATE reverify_jobs SET done = ?, failed = ? WHERE guild_id = ? AND role_id = ?",
+             [(done, failed, guild_id, role_id)]),
+            ("DELETE FROM reverify_members WHERE guild_id = ? AND role_id = ? AND member_id = ?",
+             [(guild_id, role_id, member_id) for member_id in finished_ids])
+        ])
+
+    async def finish_reverify_job(self, guild_id: int, role_id: int):
+        await self.run(self.write_all, [
+            ("DELETE FROM reverify_jobs WHERE guild_id = ? AND role_id = ?",
+             [(guild_id, role_id)]),
+            ("DELETE FROM reverify_members WHERE guild_id = ? AND role_id = ?",
+             [(guild_id, role_id)])
+        ])
+
+    # Users that can't be DMed
+
+    def load_dm_blocked(self):
+        return {row[0] for row in self.connection.execute("SELECT user_id FROM dm_blocked")}
+
+    async def add_dm_blocked(self, user_id: int):
+        await self.run(self.write, "INSERT OR IGNORE INTO dm_blocked VALUES (?)",
+                       [(user_id,)])
+
+    # Guilds being verified, which are resumed after a restart
+
+    def load_verifying_guilds(self):
+        return [row[0] for row in self.connection.execute(
+            "SELECT guild_id FROM verifying_guilds")]
+
+    async def set_verifying(self, guild_id: int, verifying: bool):
+        if verifying:
+            await self.run(self.write, "INSERT OR IGNORE INTO verifying_guilds VALUES (?)",
+                           [(guild_id,)])
+        else:
+            await self.run(self.write, "DELETE FROM verifying_guilds WHERE guild_id = ?",
+                           [(guild_id,)])
+
+    # What verification last applied to each respondent (see
+    # `applied_state.AppliedStates`)
+
+    def load_applied_states(self):
+        return self.connection.execute(
+            "SELECT guild_id, username, member_id, digest, applied_at FROM applied_states"
+        ).fetchall()
+
+    async def store_applied_states(self, rows):
+        await self.run(self.write, """
+            INSERT OR REPLACE INTO applied_states
+            (guild_id, username, member_id, digest, applied_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+
+    async def forget_applied_states(self, guild_id: int, member_ids):
+        await self.run(self.write,
+                       "DELETE FROM applied_states WHERE guild_id = ? AND member_id = ?",
+                       [(guild_id, member_id) for member_id in member_ids])
+
+    # Fetched sheet rows, which are kept for restarts and shared between
+    # processes (see `sheet_cache.SheetCache`)
+
+    def read_sheet_fetch(self, spreadsheet_id: str, range_name: str):
+        row = self.connection.execute("""
+            SELECT generation, row_count, cycles_since_resync, fetched_at
+            FROM sheet_fetches WHERE spreadsheet_id = ? AND range_name = ?
+        """, (spreadsheet_id, range_name)).fetchone()
+
+        if row is None:
+            return None
+
+        generation, row_count, cycles_since_resync, fetched_at = row
+
+        return {
+            "generation": generation,
+            "row_count": row_count,
+            "cycles_since_resync": cycles_since_resync,
+            "fetched_at": fetched_at
+        }
+
+    async def load_sheet_fetch(self, spreadsheet_id: str, range_name: str):
+        """
+        Returns the state of the rows stored for a sheet source, or None if
+        none have been stored yet.
+        """
+        return await self.run(self.read_sheet_fetch, spreadsheet_id, range_name)
+
+    def take_fetch_lease(self, spreadsheet_id: str, range_name: str, holder: str,
+                         now: float, lease_seconds: float, fresh_seconds: float):
+        with self.connection:
+            cursor = self.connection.execute("""
+                INSERT INTO sheet_fetches (spreadsheet_id, range_name, leader, lease_expires)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (spreadsheet_id, range_name) DO UPDATE SET
+                    leader = excluded.leader,
+                    lease_expires = excluded.lease_expires
+                WHERE lease_expires < ? AND fetched_at < ?
+            """, (spreadsheet_id, range_name, holder, now + lease_seconds,
+                  now, now - fresh_seconds))
+
+        return cursor.rowcount == 1
+
+    async def acquire_fetch_lease(self, spreadsheet_id: str, range_name: str, holder: str,
+                                  now: float, lease_seconds: float, fresh_seconds: float):
+        """
+        Tries to become the process that fetches a sheet source this cycle.
+
+        Fails if the source was fetched in the last `fresh_seconds`, or if
+        another process is fetching it right now.
+        """
+        return await self.run(self.take_fetch_lease, spreadsheet_id, range_name,
+                              holder, now, lease_seconds, fresh_seconds)
+
+    async def release_fetch_lease(self, spreadsheet_id: str, range_name: str, holder: str):
+        await self.run(self.write, """
+            UPDATE sheet_fetches SET lease_expires = 0
+            WHERE spreadsheet_id = ? AND range_name = ? AND leader = ?
+        """, [(spreadsheet_id, range_name, holder)])
+
+    def read_sheet_rows(self, spreadsheet_id: str, range_name: str, start: int):
+        return [json.loads(row_values) for (row_values,) in self.connection.execute("""
+            SELECT row_values FROM sheet_rows
+            WHERE spreadsheet_id = ? AND range_name = ? AND row_index >= ?
+            ORDER BY row_index
+        """, (spreadsheet_id, range_name, start))]
+
+    async def load_sheet_rows(self, spreadsheet_id: str, range_name: str, start=0):
+        """
+        Returns the stored rows of a sheet source, starting at row `start`.
+        """
+        return await self.run(self.read_sheet_rows, spreadsheet_id, range_name, start)
+
+    def write_sheet_rows(self, spreadsheet_id: str, range_name: str, rows, start: int,
+                         full_resync: bool, cycles_since_resync: int, now: float):
+        key = (spreadsheet_id, range_name)
+
+        with self.connection:
+            # Processes that don't share fetches never take a lease first
+            self.connection.execute(
+                "INSERT OR IGNORE INTO sheet_fetches (spreadsheet_id, range_name) VALUES (?, ?)",
+                key)
+
+            if full_resync:
+                # Readers notice the new generation and re-read every row
+                self.connection.execute(
+                    "DELETE FROM sheet_rows WHERE spreadsheet_id = ? AND range_name = ?", key)
+                self.connection.execute("""
+                    UPDATE sheet_fetches SET generation = generation + 1
+                    WHERE spreadsheet_id = ? AND range_name = ?
+                """, key)
+
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO sheet_rows VALUES (?, ?, ?, ?)",
+                [(*key, start + idx, json.dumps(row)) for idx, row in enumerate(rows)])
+            self.connection.execute("""
+                UPDATE sheet_fetches SET
+                    row_count = ?, cycles_since_resync = ?, fetched_at = ?, lease_expires = 0
+                WHERE spreadsheet_id = ? AND range_name = ?
+            """, (start + len(rows), cycles_since_resync, now, *key))
+
+            return self.connection.execute(
+                "SELECT generation FROM sheet_fetches WHERE spreadsheet_id = ? AND range_name = ?",
+                key).fetchone()[0]
+
+    async def store_sheet_rows(self, spreadsheet_id: str, range_name: str, rows, start: int,
+                               full_resync: bool, cycles_since_resync: int, now: float):
+        """
+        Stores rows fetched for a sheet source and releases its fetch lease.
+
+        Returns the generation of the stored rows, which changes on every full
+        re-read.
+        """
+        return await self.run(self.write_sheet_rows, spreadsheet_id, range_name, rows,
+                              start, full_resync, cycles_since_resync, now)
+
+    # Migration from the old pickle files
+
+    def migrate_pickles(self, guild_file="guild_data.pickle",
+                        modrole_file="modroles.pickle"):
+        """
+        Imports guild_data.pickle and modroles.pickle into the database, once.
+
+        The pickle files are renamed afterwards so that it's obvious they are
+        no longer used.
+        """
+        with self.connection:
+            # Other processes sharing the database wait here until the
+            # migration is done
+            self.connection.execute("BEGIN IMMEDIATE")
+
+            if self.connection.execute(
+                    "SELECT 1 FROM migrations WHERE name = 'pickles'").fetchone():
+                return
+
+            if os.path.exists(guild_file):
+                with open(guild_file, "rb") as data_file:
+                    guild_data = pickle.load(data_file)
+
+                for guild_id, data in guild_data.items():
+                    if (role_id := data.get("verified_role")) is not None:
+                        self.connection.execute(
+                            "INSERT OR REPLACE INTO verified_roles VALUES (?, ?)",
+                            (guild_id, role_id))
+
+                    for kind in ("roles", "users"):
+                        self.connection.executemany(
+                            "INSERT OR IGNORE INTO ignores VALUES (?, ?, ?)",
+                            [(guild_id, kind, target_id)
+                             for target_id in data["ignores"][kind]])
+
+                    self.connection.executemany(
+                        "INSERT OR REPLACE INTO overrides VALUES (?, ?, ?)",
+                        [(guild_id, user_id, nickname)
+                         for user_id, nickname in data["overrides"].items()])
+
+            if os.path.exists(modrole_file):
+                with open(modrole_file, "rb") as mod_file:
+                    modroles = pickle.load(mod_file)
+
+                for guild_id, role_ids in modroles.items():
+                    self.connection.executemany(
+                        "INSERT OR IGNORE INTO modroles VALUES (?, ?)",
+                        [(guild_id, role_id) for role_id in role_ids])
+
+            self.connection.execute(
+                "INSERT INTO migrations (name) VALUES ('pickles')")
+
+        for old_file in (guild_file, modrole_file):
+            if os.path.exists(old_file):
+                os.replace(old_file, old_file + ".migrated")
@@ -0,0 +1,111 @@
+"""
+Sets up the verification cog against the fake guild and sheet from
+benchmark.py, for the tests that exercise it end to end.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+
+import benchmark
+import nickname_validation
+import sheets
+import snapshot
+from action_scheduler import ActionScheduler
+from dm_outbox import DMOutbox
+from guild_worker import GuildWorker
+from sheets_bridge import Verification
+from storage import Storage
+
+GUILD_ID = benchmark.GUILD_ID
+VERIFIED_ROLE_ID = benchmark.VERIFIED_ROLE_ID
+
+
+def use_temp_config(test_case):
+    """
+    Points the bot's sheet config at a temporary file for the duration of a
+    test, so nothing is read from or written to the working directory.
+    """
+    directory = tempfile.TemporaryDirectory()
+    test_case.addCleanup(directory.cleanup)
+
+    config_path = os.path.join(directory.name, "sheetsconfig.yaml")
+
+    with open(config_path, "w") as config:
+        config.write("spreadsheet_id: test\n"
+                     "range_name: Form Responses 1!A2:C\n"
+                     f"metrics_file: {os.path.join(directory.name, 'authbot.prom')}\n")
+
+    old_config = sheets.config
+    sheets.config = sheets.SheetsConfig(config_path)
+    test_case.addCleanup(setattr, sheets, "config", old_config)
+
+    return directory.name
+
+
+async def make_verification(test_case, member_count: int, rows=None, storage=None,
+                            guild=None, **options):
+    """
+    Returns a verification cog for a fake guild with `member_count` members,
+    reading `rows` (by default one valid response per member). The guild is
+    configured and verifying, with a worker that never runs out of time.
+    """
+    logger = logging.getLogger("tests")
+
+    if storage is None:
+        storage = Storage(":memory:")
+        test_case.addCleanup(storage.close)
+
+        await storage.set_verified_role(GUILD_ID, VERIFIED_ROLE_ID)
+        await storage.set_verifying(GUILD_ID, True)
+
+    if guild is None:
+        guild = benchmark.FakeGuild(GUILD_ID, member_count, benchmark.CallCounter())
+
+    cog = Verification(benchmark.FakeBot(guild), None, logger, storage,
+                       DMOutbox(storage, logger), **options)
+    cog.sheets_client = benchmark.make_fake_client(
+        sheets, benchmark.make_rows(member_count) if rows is None else rows)
+
+    # Tests don't wait on the background rate budget
+    cog.scheduler = ActionScheduler(background_rate=10 ** 9, metrics=cog.metrics)
+
+    worker = GuildWorker(GUILD_ID, cog.verify_guild, logger, time_budget=float("inf"))
+    worker.start()
+    cog.workers[GUILD_ID] = worker
+
+    test_case.addAsyncCleanup(close_verification, cog)
+
+    return cog, guild
+
+
+async def close_verification(cog: Verification):
+    for worker in cog.workers.values():
+        worker.cancel()
+
+    scheduler_workers = cog.scheduler.workers
+    cog.scheduler.close()
+
+    if cog.sheets_client is not None:
+        cog.sheets_client.close()
+
+    await asyncio.gather(*scheduler_workers, return_exceptions=True)
+
+
+async def run_cycle(cog: Verification):
+    """
+    Polls the sheet once and waits for the guild's worker to finish.
+    """
+    await benchmark.run_cycle(cog, cog.workers[GUILD_ID])
+
+
+def load_rows(cog: Verification, rows: list):
+    """
+    Loads rows into the guild's snapshot the way a full poll would, without
+    handing them to the worker.
+    """
+    responses, _ = snapshot.parse_rows(rows, sheets.config.columns)
+    nickname_validation.validate_responses(responses)
+    cog.sheets_data[cog.guild_source(GUILD_ID)] = snapshot.SheetSnapshot(responses)
+
+    return [response.username for response in responses]
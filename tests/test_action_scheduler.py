@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+
+from action_scheduler import ActionScheduler, Priority, RateBudget
+
+
+def record(results: list, value):
+    async def action():
+        results.append(value)
+        return value
+
+    return action
+
+
+class RateBudgetTest(unittest.TestCase):
+    def test_takes_tokens_until_empty(self):
+        budget = RateBudget(2, 60.0)
+
+        self.assertTrue(budget.try_acquire())
+        self.assertTrue(budget.try_acquire())
+        self.assertFalse(budget.try_acquire())
+
+    def test_reports_time_until_next_token(self):
+        budget = RateBudget(2, 60.0)
+        self.assertEqual(budget.seconds_until_token(), 0)
+
+        budget.try_acquire()
+        budget.try_acquire()
+        self.assertAlmostEqual(budget.seconds_until_token(), 30.0, delta=0.1)
+
+
+class ActionSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.results = []
+
+    def make_scheduler(self, rate: int, per: float, **options):
+        scheduler = ActionScheduler(background_rate=rate, background_per=per, **options)
+        self.addAsyncCleanup(self.close_scheduler, scheduler)
+        return scheduler
+
+    async def close_scheduler(self, scheduler: ActionScheduler):
+        workers = scheduler.workers
+        scheduler.close()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def test_low_priority_actions_respect_the_budget(self):
+        scheduler = self.make_scheduler(3, 60.0)
+
+        for idx in range(5):
+            scheduler.submit(1, "member_edit", record(self.results, idx))
+
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.results, [0, 1, 2])
+
+    async def test_backlogged_guild_does_not_hold_up_other_guilds(self):
+        scheduler = self.make_scheduler(2, 60.0)
+
+        for idx in range(20):
+            scheduler.submit(1, "member_edit", record(self.results, (1, idx)))
+
+        other = scheduler.submit(2, "member_edit", record(self.results, (2, 0)))
+
+        self.assertEqual(await asyncio.wait_for(other, 1.0), (2, 0))
+        self.assertEqual(len([result for result in self.results if result[0] == 1]), 2)
+
+    async def test_guilds_are_served_round_robin(self):
+        scheduler = self.make_scheduler(10, 60.0)
+
+        futures = [scheduler.submit(guild_id, "member_edit", record(self.results, guild_id))
+                   for guild_id in (1, 1, 1, 2, 2, 2)]
+        await asyncio.wait_for(asyncio.gather(*futures), 1.0)
+
+        # Workers run concurrently, but neither guild gets ahead by more than
+        # a worker's worth of actions
+        self.assertEqual(sorted(self.results[:2]), [1, 2])
+
+    async def test_high_priority_actions_skip_the_budget(self):
+        scheduler = self.make_scheduler(1, 60.0)
+
+        for idx in range(5):
+            scheduler.submit(1, "member_edit", record(self.results, idx))
+
+        command = scheduler.submit(1, "send", record(self.results, "command"), Priority.HIGH)
+
+        self.assertEqual(await asyncio.wait_for(command, 1.0), "command")
+
+    async def test_cancelled_actions_dont_use_up_the_budget(self):
+        scheduler = self.make_scheduler(1, 60.0)
+
+        # Nothing runs until the workers get to the queue
+        cancelled = scheduler.submit(1, "member_edit", record(self.results, "cancelled"))
+        cancelled.cancel()
+        kept = scheduler.submit(1, "member_edit", record(self.results, "kept"))
+
+        self.assertEqual(await asyncio.wait_for(kept, 1.0), "kept")
+        self.assertEqual(self.results, ["kept"])
+
+    async def test_errors_are_passed_to_the_caller(self):
+        scheduler = self.make_scheduler(1, 60.0)
+
+        async def fail():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            await asyncio.wait_for(scheduler.submit(1, "member_edit", fail), 1.0)
+
+
+    async def test_bulk_actions_have_their_own_budget(self):
+        scheduler = self.make_scheduler(1, 60.0, bulk_rate=10, bulk_per=60.0)
+
+        for idx in range(3):
+            scheduler.submit(1, "member_edit", record(self.results, ("low", idx)))
+
+        bulk = [scheduler.submit(1, "member_edit", record(self.results, ("bulk", idx)),
+                                 Priority.BULK)
+                for idx in range(5)]
+
+        await asyncio.wait_for(asyncio.gather(*bulk), 1.0)
+        self.assertEqual([result for result in self.results if result[0] == "low"],
+                         [("low", 0)])
+
+    async def test_bulk_actions_run_concurrently_on_one_route(self):
+        scheduler = self.make_scheduler(1, 60.0, bulk_rate=10, bulk_per=60.0,
+                                        bulk_concurrency=3)
+        running = []
+        release = asyncio.Event()
+
+        async def edit():
+            running.append(None)
+            await release.wait()
+
+        futures = [scheduler.submit(1, "member_edit", edit, Priority.BULK) for _ in range(5)]
+
+        # The route allows one verification edit at a time, but bulk jobs are
+        # only held to their own limit
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(running), 3)
+
+        release.set()
+        await asyncio.wait_for(asyncio.gather(*futures), 1.0)
+        self.assertEqual(len(running), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import datetime
+import types
+import unittest
+
+from applied_state import AppliedStates, outcome_digest
+
+
+def fake_guild(guild_id: int, members):
+    return types.SimpleNamespace(id=guild_id, get_member=lambda member_id: members.get(member_id))
+
+
+def joined(timestamp: float):
+    # discord.py gives join times as naive UTC datetimes
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).replace(tzinfo=None)
+
+
+class OutcomeDigestTest(unittest.TestCase):
+    def test_digest_depends_on_nickname_and_role(self):
+        self.assertEqual(outcome_digest("John D", 1), outcome_digest("John D", 1))
+        self.assertNotEqual(outcome_digest("John D", 1), outcome_digest("John E", 1))
+        self.assertNotEqual(outcome_digest("John D", 1), outcome_digest("John D", 2))
+
+
+class AppliedStatesTest(unittest.TestCase):
+    def setUp(self):
+        self.states = AppliedStates([(1, "user#0001", 10, "digest", 100.0)])
+
+    def test_loads_stored_rows(self):
+        state = self.states.get(1, "user#0001")
+
+        self.assertEqual((state.member_id, state.digest, state.applied_at), (10, "digest", 100.0))
+        self.assertTrue(self.states.unchanged(1, "user#0001", "digest"))
+        self.assertFalse(self.states.unchanged(1, "user#0001", "other"))
+        self.assertFalse(self.states.unchanged(2, "user#0001", "digest"))
+
+    def test_record_returns_the_row_to_store(self):
+        row = self.states.record(1, "other#0002", 11, "digest", 200.0)
+
+        self.assertEqual(row, (1, "other#0002", 11, "digest", 200.0))
+        self.assertEqual(self.states.get(1, "other#0002").member_id, 11)
+
+    def test_forget_by_member(self):
+        self.assertTrue(self.states.forget(1, 10))
+        self.assertIsNone(self.states.get(1, "user#0001"))
+        self.assertFalse(self.states.forget(1, 10))
+
+    def test_username_moving_to_another_member_replaces_its_state(self):
+        self.states.record(1, "user#0001", 20, "digest", 200.0)
+
+        self.assertEqual(self.states.get(1, "user#0001").member_id, 20)
+        self.assertFalse(self.states.forget(1, 10))
+        self.assertTrue(self.states.forget(1, 20))
+
+    def test_prune_forgets_members_who_left_or_rejoined(self):
+        self.states.record(1, "stayed#0002", 11, "digest", 100.0)
+        self.states.record(1, "rejoined#0003", 12, "digest", 100.0)
+
+        guild = fake_guild(1, {
+            11: types.SimpleNamespace(joined_at=joined(50.0)),
+            12: types.SimpleNamespace(joined_at=joined(150.0))
+        })
+
+        self.assertEqual(sorted(self.states.prune(guild)), [10, 12])
+        self.assertIsNotNone(self.states.get(1, "stayed#0002"))
+        self.assertIsNone(self.states.get(1, "rejoined#0003"))
+
+
+if __name__ == "__main__":
+    unittest.main()
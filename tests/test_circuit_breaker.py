@@ -0,0 +1,113 @@
+import logging
+import unittest
+from unittest import mock
+
+import httplib2
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+
+import circuit_breaker
+from circuit_breaker import BreakerState, CircuitBreaker
+
+
+def http_error(status: int):
+    return HttpError(httplib2.Response({"status": status}), b"")
+
+
+class IsTransientTest(unittest.TestCase):
+    def test_rate_limits_and_server_errors_are_transient(self):
+        self.assertTrue(circuit_breaker.is_transient(http_error(429)))
+        self.assertTrue(circuit_breaker.is_transient(http_error(503)))
+        self.assertTrue(circuit_breaker.is_transient(TimeoutError()))
+
+    def test_missing_access_and_bad_credentials_are_permanent(self):
+        self.assertFalse(circuit_breaker.is_transient(http_error(403)))
+        self.assertFalse(circuit_breaker.is_transient(RefreshError("invalid_grant")))
+
+
+class BackoffDelayTest(unittest.TestCase):
+    def test_delays_grow_up_to_the_maximum(self):
+        for attempt in range(10):
+            limit = min(circuit_breaker.RETRY_MAX_DELAY,
+                        circuit_breaker.RETRY_BASE_DELAY * 2 ** attempt)
+
+            for _ in range(20):
+                self.assertTrue(0 <= circuit_breaker.backoff_delay(attempt) <= limit)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(circuit_breaker.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # The breaker logs every state change, which would only clutter the
+        # test output
+        logger = logging.getLogger("test_circuit_breaker")
+        logger.propagate = False
+        logger.addHandler(logging.NullHandler())
+
+        self.breaker = CircuitBreaker("spreadsheet", logger)
+
+    def fail(self, times: int, error=None):
+        for _ in range(times):
+            opened = self.breaker.record_failure(error or TimeoutError("timed out"))
+
+        return opened
+
+    def test_opens_after_repeated_transient_failures(self):
+        self.assertFalse(self.fail(circuit_breaker.FAILURE_THRESHOLD - 1))
+        self.assertTrue(self.breaker.allow())
+
+        self.assertTrue(self.fail(1))
+        self.assertIs(self.breaker.state, BreakerState.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_opens_right_away_on_permanent_errors(self):
+        self.assertTrue(self.fail(1, http_error(403)))
+        self.assertIs(self.breaker.state, BreakerState.OPEN)
+
+    def test_probes_after_the_open_period(self):
+        self.fail(circuit_breaker.FAILURE_THRESHOLD)
+
+        self.now += circuit_breaker.OPEN_SECONDS - 1
+        self.assertFalse(self.breaker.allow())
+
+        self.now += 1
+        self.assertTrue(self.breaker.allow())
+        self.assertIs(self.breaker.state, BreakerState.HALF_OPEN)
+
+    def test_successful_probe_closes_the_breaker(self):
+        self.fail(circuit_breaker.FAILURE_THRESHOLD)
+        self.now += circuit_breaker.OPEN_SECONDS
+        self.breaker.allow()
+
+        self.breaker.record_success()
+
+        self.assertIs(self.breaker.state, BreakerState.CLOSED)
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertEqual(self.breaker.open_seconds, circuit_breaker.OPEN_SECONDS)
+
+    def test_failed_probes_double_the_open_period_up_to_the_maximum(self):
+        self.fail(circuit_breaker.FAILURE_THRESHOLD)
+        expected = circuit_breaker.OPEN_SECONDS
+
+        for _ in range(10):
+            self.now += self.breaker.open_seconds
+            self.assertTrue(self.breaker.allow())
+            self.assertTrue(self.fail(1))
+
+            expected = min(expected * 2, circuit_breaker.MAX_OPEN_SECONDS)
+            self.assertEqual(self.breaker.open_seconds, expected)
+            self.assertIs(self.breaker.state, BreakerState.OPEN)
+
+    def test_status_text_shows_the_state(self):
+        self.assertEqual(self.breaker.status_text(), "closed")
+
+        self.fail(circuit_breaker.FAILURE_THRESHOLD)
+        self.assertTrue(self.breaker.status_text().startswith("open, probing in 60s"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import types
+import unittest
+
+from googleapiclient.errors import HttpError
+
+import sheets
+import support
+from circuit_breaker import BreakerState
+
+GOOD_SOURCE = sheets.SheetSource("test", "Form Responses 1!A2:C")
+BAD_SOURCE = sheets.SheetSource("test", "Missing Sheet!A2:C")
+
+
+def bad_request():
+    response = types.SimpleNamespace(status=400, reason="Bad Request")
+    return HttpError(response, b'{"error": {"message": "Unable to parse range"}}')
+
+
+class FetchSpreadsheetTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        support.use_temp_config(self)
+        self.cog, self.guild = await support.make_verification(self, 5)
+
+        client = self.cog.sheets_client
+        serve_rows = client.batch_get
+        self.requests = []
+
+        # Like the Sheets API, a batch with a missing sheet fails as a whole
+        def batch_get(spreadsheet_id: str, ranges: list):
+            self.requests.append(list(ranges))
+
+            if any(range_name.startswith("Missing") for range_name in ranges):
+                raise bad_request()
+
+            return serve_rows(spreadsheet_id, ranges)
+
+        client.batch_get = batch_get
+
+    async def test_bad_range_only_fails_its_own_source(self):
+        good, bad = sheets.SheetCursor(GOOD_SOURCE), sheets.SheetCursor(BAD_SOURCE)
+
+        with self.assertLogs("tests"):
+            fetched = await self.cog.fetch_with_breakers(self.cog.sheets_client, [good, bad])
+
+        self.assertEqual(list(fetched), [good])
+        self.assertEqual(len(fetched[good][0]), 5)
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.cog.breakers["test"].state, BreakerState.CLOSED)
+        self.assertEqual(self.cog.breakers["test"].failures, 0)
+
+    async def test_sources_are_checked_before_they_are_saved(self):
+        self.assertIsNone(await self.cog.check_source(GOOD_SOURCE))
+        self.assertEqual(await self.cog.check_source(BAD_SOURCE), "Unable to parse range")
+
+    async def test_range_notation_is_checked_without_a_client(self):
+        self.cog.sheets_client.close()
+        self.cog.sheets_client = None
+
+        self.assertIsNone(await self.cog.check_source(GOOD_SOURCE))
+        self.assertIsNotNone(await self.cog.check_source(
+            sheets.SheetSource("test", "Form Responses 1")))
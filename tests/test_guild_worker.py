@@ -0,0 +1,53 @@
+import logging
+import unittest
+
+from guild_worker import GuildConfigError, GuildWorker
+
+
+class GuildWorkerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.passes = []
+        self.worker = GuildWorker(1, self.verify, logging.getLogger("tests"))
+        self.worker.start()
+
+    async def verify(self, guild_id: int, usernames, deadline: float):
+        self.passes.append(set(usernames))
+
+        # The first pass runs out of time with one username left
+        if len(self.passes) == 1:
+            return {min(usernames)}
+
+        return set()
+
+    async def test_leftover_is_verified_without_another_poll(self):
+        self.worker.submit({"a#0001", "b#0001"})
+        await self.worker.task
+
+        self.assertEqual(self.passes, [{"a#0001", "b#0001"}, {"a#0001"}])
+        self.assertEqual(self.worker.pending, set())
+
+    async def test_config_errors_stop_the_worker(self):
+        async def verify(guild_id: int, usernames, deadline: float):
+            raise GuildConfigError("no verified role is set")
+
+        self.worker.verify = verify
+
+        with self.assertLogs("tests", logging.ERROR):
+            self.worker.submit({"a#0001"})
+            await self.worker.task
+
+        self.assertFalse(self.worker.running)
+        self.assertEqual(self.worker.pending, set())
+
+    async def test_failed_passes_keep_their_usernames(self):
+        async def verify(guild_id: int, usernames, deadline: float):
+            raise RuntimeError("Discord is down")
+
+        self.worker.verify = verify
+
+        with self.assertLogs("tests", logging.ERROR):
+            self.worker.submit({"a#0001"})
+            await self.worker.task
+
+        self.assertTrue(self.worker.running)
+        self.assertEqual(self.worker.pending, {"a#0001"})
@@ -0,0 +1,59 @@
+import unittest
+
+import list_pages
+from list_pages import ListPages, paginate
+
+
+class PaginateTest(unittest.TestCase):
+    def test_no_lines_make_no_pages(self):
+        self.assertEqual(paginate([]), [])
+
+    def test_pages_hold_at_most_page_lines_lines(self):
+        pages = paginate([str(idx) for idx in range(list_pages.PAGE_LINES * 2 + 1)])
+
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(len(pages[0].split("\n")), list_pages.PAGE_LINES)
+        self.assertEqual(pages[2], str(list_pages.PAGE_LINES * 2))
+
+    def test_pages_fit_into_an_embed_description(self):
+        pages = paginate(["x" * 900] * 5)
+
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(all(len(page) <= list_pages.PAGE_CHARACTERS for page in pages))
+
+    def test_overlong_lines_are_cut_off(self):
+        pages = paginate(["x" * (list_pages.PAGE_CHARACTERS + 10)])
+
+        self.assertEqual(pages, ["x" * list_pages.PAGE_CHARACTERS])
+
+
+class ListPagesTest(unittest.TestCase):
+    def test_pages_are_only_rendered_again_after_invalidating(self):
+        calls = []
+
+        def render():
+            calls.append(None)
+            return ["line"]
+
+        pages = ListPages()
+        pages.get("ignores", 1, render)
+        pages.get("ignores", 1, render)
+        self.assertEqual(len(calls), 1)
+
+        pages.invalidate("ignores", 1)
+        pages.get("ignores", 1, render)
+        self.assertEqual(len(calls), 2)
+
+    def test_clear_drops_every_list_of_a_guild(self):
+        pages = ListPages()
+        pages.get("ignores", 1, lambda: ["a"])
+        pages.get("overrides", 1, lambda: ["b"])
+        pages.get("ignores", 2, lambda: ["c"])
+
+        pages.clear(1)
+
+        self.assertEqual(list(pages.pages), [("ignores", 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
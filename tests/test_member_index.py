@@ -0,0 +1,59 @@
+import unittest
+
+import benchmark
+from member_index import MemberIndex
+
+
+class MemberIndexTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.guild = benchmark.FakeGuild(1, 3, benchmark.CallCounter())
+        self.index = MemberIndex()
+
+    async def test_index_is_built_from_the_member_list(self):
+        resolved = await self.index.resolve(self.guild, ["user1#0001", "user4#0001",
+                                                         "AuthBot#0001"])
+
+        self.assertEqual(resolved, {"user1#0001": self.guild.get_member(1)})
+
+    async def test_renamed_members_are_found_by_their_new_name(self):
+        member = self.guild.get_member(1)
+        self.index.ensure_built(self.guild)
+
+        member.name = "renamed"
+        self.index.rename(member)
+
+        self.assertIsNone(self.index.get(self.guild, "user1#0001"))
+        self.assertIs(self.index.get(self.guild, "renamed#0001"), member)
+
+    async def test_rename_keeps_the_new_owner_of_a_username(self):
+        first, second = self.guild.get_member(1), self.guild.get_member(2)
+        self.index.ensure_built(self.guild)
+
+        # The second member takes the first one's old name before the first
+        # member's rename is seen
+        second.name = "user1"
+        self.index.rename(second)
+        first.name = "renamed"
+        self.index.rename(first)
+
+        self.assertIs(self.index.get(self.guild, "user1#0001"), second)
+        self.assertIs(self.index.get(self.guild, "renamed#0001"), first)
+        self.assertIsNone(self.index.get(self.guild, "user2#0001"))
+
+    async def test_leaving_keeps_the_new_owner_of_a_username(self):
+        first, second = self.guild.get_member(1), self.guild.get_member(2)
+        self.index.ensure_built(self.guild)
+
+        second.name = "user1"
+        self.index.rename(second)
+        self.index.remove(first)
+
+        self.assertIs(self.index.get(self.guild, "user1#0001"), second)
+
+    async def test_removed_members_are_forgotten(self):
+        member = self.guild.get_member(3)
+        self.index.ensure_built(self.guild)
+
+        self.index.remove(member)
+
+        self.assertIsNone(self.index.get(self.guild, "user3#0001"))
@@ -0,0 +1,61 @@
+import unittest
+
+import benchmark
+from member_resolver import MemberResolver
+
+
+class MemberResolverTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.guild = benchmark.FakeGuild(1, 2500, benchmark.CallCounter())
+        self.resolver = MemberResolver()
+
+    async def test_usernames_are_mapped_from_the_member_list(self):
+        usernames = [f"user{member_id}#0001" for member_id in range(1, 301)]
+        resolved = await self.resolver.resolve(self.guild, usernames)
+
+        self.assertEqual(len(resolved), 300)
+        self.assertIs(resolved["user42#0001"], self.guild.get_member(42))
+        self.assertEqual(self.guild.member_pages, 3)
+        self.assertEqual(self.guild.member_queries, 0)
+
+    async def test_later_lookups_are_batched_by_id(self):
+        await self.resolver.resolve(self.guild, ["user1#0001"])
+
+        usernames = [f"user{member_id}#0001" for member_id in range(2, 252)]
+        resolved = await self.resolver.resolve(self.guild, usernames)
+
+        self.assertEqual(len(resolved), 250)
+        self.assertEqual(self.guild.member_pages, 3)
+        self.assertEqual(self.guild.member_queries, 3)
+
+    async def test_usernames_not_in_the_guild_arent_queried(self):
+        await self.resolver.resolve(self.guild, ["user1#0001"])
+
+        self.assertEqual(await self.resolver.resolve(self.guild, ["stranger#0001"]), {})
+        self.assertEqual(self.guild.member_queries, 0)
+
+    async def test_rename_keeps_the_new_owner_of_a_username(self):
+        await self.resolver.resolve(self.guild, ["user1#0001", "user2#0001"])
+        first, second = self.guild.get_member(1), self.guild.get_member(2)
+
+        # The second member takes the first one's old name after they rename
+        first.name = "renamed"
+        second.name = "user1"
+        self.resolver.rename(second)
+        self.resolver.rename(first)
+
+        resolved = await self.resolver.resolve(self.guild, ["user1#0001", "renamed#0001",
+                                                            "user2#0001"])
+
+        self.assertIs(resolved["user1#0001"], second)
+        self.assertIs(resolved["renamed#0001"], first)
+        self.assertNotIn("user2#0001", resolved)
+
+    async def test_removed_members_are_forgotten(self):
+        await self.resolver.resolve(self.guild, ["user1#0001"])
+        member = self.guild.members_by_id.pop(1)
+
+        self.resolver.remove(member)
+
+        self.assertEqual(await self.resolver.resolve(self.guild, ["user1#0001"]), {})
+        self.assertEqual(self.resolver.usernames_by_id[1].get(1), None)
@@ -0,0 +1,22 @@
+import unittest
+
+from metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def test_single_process_exports_unlabelled_series(self):
+        metrics = Metrics()
+        metrics.increment("cycles")
+
+        self.assertEqual(metrics.file_path("authbot.prom"), "authbot.prom")
+        self.assertIn("authbot_cycles_total 1\n", metrics.prometheus_text())
+
+    def test_shards_export_to_their_own_file(self):
+        metrics = Metrics(shard="0-1")
+        metrics.increment("cycles")
+        text = metrics.prometheus_text()
+
+        self.assertEqual(metrics.file_path("metrics/authbot.prom"),
+                         "metrics/authbot.shard0-1.prom")
+        self.assertIn('authbot_cycles_total{shard="0-1"} 1\n', text)
+        self.assertIn('authbot_phase_runs_total{phase="fetch",shard="0-1"} 0\n', text)
@@ -0,0 +1,28 @@
+import unittest
+
+from nickname_validation import ValidatedRow, validate, validate_responses
+from snapshot import Response
+
+
+class ValidateTest(unittest.TestCase):
+    def test_matching_nickname_is_valid(self):
+        self.assertEqual(validate("doej123@school.org", "John Doe"),
+                         ValidatedRow("doej123", True))
+
+    def test_nickname_not_matching_the_username_is_invalid(self):
+        self.assertEqual(validate("doej123@school.org", "Nick"),
+                         ValidatedRow("doej123", False))
+
+    def test_email_without_school_username(self):
+        self.assertEqual(validate("123@example.com", "John Doe"),
+                         ValidatedRow(None, False))
+
+    def test_validate_responses_stores_the_result(self):
+        response = Response("user#0001", "John Doe", "doej123@school.org")
+        validate_responses([response])
+
+        self.assertEqual(response.validated, ValidatedRow("doej123", True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+from google.auth.exceptions import RefreshError
+
+import benchmark
+import sheets
+import support
+from sheet_cache import SheetCache
+from storage import Storage
+
+SOURCE = sheets.SheetSource("test", "Form Responses 1!A2:C")
+
+
+class SheetCacheTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Two caches on separate connections to one database stand in for two
+    processes sharing it.
+    """
+
+    async def asyncSetUp(self):
+        support.use_temp_config(self)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "authbot.db")
+
+        self.storages = [Storage(path), Storage(path)]
+
+        for storage in self.storages:
+            self.addCleanup(storage.close)
+
+        self.caches = [SheetCache(storage, fresh_seconds=60) for storage in self.storages]
+        self.rows = benchmark.make_rows(5)
+        self.client = benchmark.make_fake_client(sheets, self.rows)
+        self.addCleanup(self.client.close)
+        self.fetches = 0
+
+    async def fetch(self, client, cursors):
+        self.fetches += 1
+        return await sheets.fetch_cursors(client, cursors)
+
+    async def fail(self, client, cursors):
+        self.fetches += 1
+        return {}
+
+    async def test_only_one_process_fetches_each_cycle(self):
+        first, second = sheets.SheetCursor(SOURCE), sheets.SheetCursor(SOURCE)
+
+        fetched = await self.caches[0].fetch_cursors(self.client, [first], fetch=self.fetch)
+        cached = await self.caches[1].fetch_cursors(self.client, [second], fetch=self.fetch)
+
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(fetched[first], (self.rows, True))
+        self.assertEqual(cached[second], (self.rows, True))
+        self.assertEqual(second.row_count, 5)
+
+    async def test_new_rows_are_caught_up_on(self):
+        first, second = sheets.SheetCursor(SOURCE), sheets.SheetCursor(SOURCE)
+
+        await self.caches[0].fetch_cursors(self.client, [first], fetch=self.fetch)
+        await self.caches[1].fetch_cursors(self.client, [second], fetch=self.fetch)
+
+        new_rows = benchmark.make_rows(7)[5:]
+        await self.storages[0].store_sheet_rows(*SOURCE, new_rows, 5, False, 1, 0.0)
+
+        cached = await self.caches[1].fetch_cursors(self.client, [second], fetch=self.fetch)
+
+        self.assertEqual(cached[second], (new_rows, False))
+        self.assertEqual(second.row_count, 7)
+
+    async def test_sheets_never_fetched_are_left_out(self):
+        cursor = sheets.SheetCursor(SOURCE)
+
+        self.assertEqual(await self.caches[0].fetch_cursors(self.client, [cursor],
+                                                            fetch=self.fail), {})
+
+        # The failed fetch gave up its lease, so the other process tries next
+        fetched = await self.caches[1].fetch_cursors(
+            self.client, [sheets.SheetCursor(SOURCE)], fetch=self.fetch)
+
+        self.assertEqual(self.fetches, 2)
+        self.assertEqual(len(fetched), 1)
+
+
+class SharedFetchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        support.use_temp_config(self)
+        self.cog, self.guild = await support.make_verification(self, 5, shared_fetch=True)
+
+    async def test_failed_first_fetch_doesnt_abort_the_cycle(self):
+        def batch_get(spreadsheet_id: str, ranges: list):
+            raise RefreshError("invalid_grant")
+
+        self.cog.sheets_client.batch_get = batch_get
+
+        with self.assertLogs("tests"):
+            await self.cog.poll_sheets()
+
+        self.assertEqual(self.cog.metrics.counters["cycles"], 1)
+        self.assertEqual(self.cog.sheets_data, {})
@@ -0,0 +1,64 @@
+import unittest
+
+from sheets import SheetCursor, SheetSource
+
+
+def make_cursor(range_name="Form Responses 1!A2:C", resync_cycles=3):
+    return SheetCursor(SheetSource("spreadsheet", range_name), resync_cycles=resync_cycles)
+
+
+class SheetCursorTest(unittest.TestCase):
+    def test_first_fetch_reads_the_whole_range(self):
+        self.assertEqual(make_cursor().next_range(), ("Form Responses 1!A2:C", True))
+
+    def test_later_fetches_only_read_new_rows(self):
+        cursor = make_cursor()
+        cursor.apply([["a"], ["b"], ["c"]], True)
+
+        self.assertEqual(cursor.next_range(), ("Form Responses 1!A5:C", False))
+
+        cursor.apply([["d"]], False)
+        self.assertEqual(cursor.row_count, 4)
+        self.assertEqual(cursor.next_range(), ("Form Responses 1!A6:C", False))
+
+    def test_whole_range_is_reread_every_few_cycles(self):
+        cursor = make_cursor(resync_cycles=2)
+        cursor.apply([["a"]], True)
+
+        cursor.apply([], False)
+        self.assertFalse(cursor.next_range()[1])
+
+        cursor.apply([], False)
+        self.assertTrue(cursor.next_range()[1])
+
+    def test_full_reread_replaces_previous_rows(self):
+        cursor = make_cursor()
+        cursor.apply([["a"], ["b"], ["c"]], True)
+        cursor.apply([["x"]], True)
+
+        self.assertEqual(cursor.row_count, 1)
+        self.assertEqual(cursor.tail, [["x"]])
+        self.assertEqual(cursor.cycles_since_resync, 0)
+
+    def test_exhausted_bounded_range_has_nothing_to_fetch(self):
+        cursor = make_cursor("Sheet1!A2:C3")
+        cursor.apply([["a"], ["b"]], True)
+
+        self.assertEqual(cursor.next_range(), (None, False))
+
+    def test_named_ranges_are_always_read_whole(self):
+        cursor = make_cursor("Responses")
+        cursor.apply([["a"]], True)
+
+        self.assertEqual(cursor.next_range(), ("Responses", True))
+
+    def test_reset_forgets_fetched_rows(self):
+        cursor = make_cursor()
+        cursor.apply([["a"]], True)
+        cursor.reset()
+
+        self.assertTrue(cursor.next_range()[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from storage import Storage
+
+GUILD_DATA = {
+    10: {"verified_role": 5,
+         "ignores": {"roles": {7}, "users": {8}},
+         "overrides": {8: "John D"}},
+    11: {"ignores": {"roles": set(), "users": set()},
+         "overrides": {}}
+}
+
+MODROLES = {10: [3, 4]}
+
+
+class MigratePicklesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        # The pickle files are looked for in the working directory
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+
+        self.write_pickle("guild_data.pickle", GUILD_DATA)
+        self.write_pickle("modroles.pickle", MODROLES)
+
+    def write_pickle(self, path: str, data):
+        with open(path, "wb") as data_file:
+            pickle.dump(data, data_file)
+
+    def open_storage(self):
+        storage = Storage("authbot.db")
+        self.addCleanup(storage.close)
+        return storage
+
+    def test_pickles_are_imported(self):
+        storage = self.open_storage()
+        guild_data = storage.load_guild_data()
+
+        self.assertEqual(guild_data[10]["verified_role"], 5)
+        self.assertEqual(guild_data[10]["ignores"], {"roles": {7}, "users": {8}})
+        self.assertEqual(guild_data[10]["overrides"], {8: "John D"})
+        self.assertNotIn(11, guild_data)
+        self.assertEqual(storage.load_modroles(), {10: [3, 4]})
+
+    def test_pickles_are_renamed_once_imported(self):
+        self.open_storage()
+
+        self.assertFalse(os.path.exists("guild_data.pickle"))
+        self.assertTrue(os.path.exists("guild_data.pickle.migrated"))
+        self.assertTrue(os.path.exists("modroles.pickle.migrated"))
+
+    def test_pickles_are_only_imported_once(self):
+        self.open_storage().close()
+
+        # Pickles showing up again (e.g. from a backup) are left alone
+        self.write_pickle("modroles.pickle", {12: [6]})
+
+        self.assertEqual(self.open_storage().load_modroles(), {10: [3, 4]})
+        self.assertTrue(os.path.exists("modroles.pickle"))
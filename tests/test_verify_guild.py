@@ -0,0 +1,116 @@
+import time
+import unittest
+
+import benchmark
+import support
+from action_scheduler import ActionScheduler
+
+
+class VerifyGuildTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        support.use_temp_config(self)
+        self.cog, self.guild = await support.make_verification(self, 20)
+        self.counter = self.guild.me.counter
+
+        await support.run_cycle(self.cog)
+
+    async def test_cold_cycle_verifies_every_respondent(self):
+        verified_role = self.guild.verified_role
+
+        self.assertTrue(all(verified_role in member.roles for member in self.guild.members))
+        self.assertEqual(self.guild.get_member(1).nick, "John Doe")
+
+    async def test_full_resync_corrects_drift(self):
+        member = self.guild.get_member(1)
+        member.nick = "hacked"
+        member.roles = [self.guild.default_role]
+        self.counter.calls = 0
+
+        for cursor in self.cog.sheet_cursors.values():
+            cursor.reset()
+
+        await support.run_cycle(self.cog)
+
+        self.assertEqual(self.counter.calls, 1)
+        self.assertEqual(member.nick, "John Doe")
+        self.assertIn(self.guild.verified_role, member.roles)
+
+    async def test_unchanged_members_are_not_edited_again(self):
+        self.counter.calls = 0
+
+        for cursor in self.cog.sheet_cursors.values():
+            cursor.reset()
+
+        await support.run_cycle(self.cog)
+
+        self.assertEqual(self.counter.calls, 0)
+
+
+class VerifyGuildDeadlineTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        support.use_temp_config(self)
+        self.cog, self.guild = await support.make_verification(self, 150)
+        self.counter = self.guild.me.counter
+
+        # Five edits are let through, and no more for a minute
+        self.cog.scheduler = ActionScheduler(background_rate=5, background_per=60.0,
+                                             metrics=self.cog.metrics)
+
+        self.usernames = support.load_rows(self.cog, benchmark.make_rows(150))
+
+    async def test_pass_stops_at_the_rate_budget_and_deadline(self):
+        leftover = await self.cog.verify_guild(support.GUILD_ID, self.usernames,
+                                               time.monotonic() + 0.2)
+
+        # The first batch is looked up and five of its edits go through before
+        # the deadline. Later batches aren't looked up at all.
+        self.assertEqual(self.counter.calls, 5)
+        self.assertEqual(len(leftover), 145)
+        self.assertTrue(set(self.usernames[100:]) <= leftover)
+
+    async def test_leftover_is_verified_by_the_next_pass(self):
+        leftover = await self.cog.verify_guild(support.GUILD_ID, self.usernames,
+                                               time.monotonic() + 0.2)
+
+        self.cog.scheduler.close()
+        self.cog.scheduler = ActionScheduler(background_rate=10 ** 9, metrics=self.cog.metrics)
+
+        self.assertEqual(await self.cog.verify_guild(support.GUILD_ID, leftover,
+                                                     time.monotonic() + 5.0), set())
+        self.assertEqual(self.counter.calls, 150)
+
+
+class LightMemberCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        support.use_temp_config(self)
+        self.cog, self.guild = await support.make_verification(self, 20,
+                                                               light_member_cache=True)
+        self.counter = self.guild.me.counter
+
+        await support.run_cycle(self.cog)
+
+    async def full_resync(self, cog):
+        for cursor in cog.sheet_cursors.values():
+            cursor.reset()
+
+        await support.run_cycle(cog)
+
+    async def test_unchanged_respondents_are_skipped_without_a_lookup(self):
+        self.counter.calls = 0
+        queries = self.guild.member_queries
+
+        await self.full_resync(self.cog)
+
+        self.assertEqual(self.cog.metrics.counters["members_skipped"], 20)
+        self.assertEqual(self.guild.member_queries, queries)
+        self.assertEqual(self.counter.calls, 0)
+
+    async def test_respondents_are_looked_up_again_after_a_restart(self):
+        cog, _ = await support.make_verification(self, 20, storage=self.cog.storage,
+                                                 guild=self.guild, light_member_cache=True)
+        pages = self.guild.member_pages
+
+        await self.full_resync(cog)
+
+        self.assertEqual(cog.metrics.counters["members_skipped"], 0)
+        self.assertGreater(self.guild.member_pages, pages)
@@ -44,4 +44,11 @@ def make_info_embed():
     return info_embed
 
 
-info_embed = make_info_embed()
+def __getattr__(name: str):
+    # The information embed is only built (and embedconfig.yaml only read)
+    # the first time it's used
+    if name == "info_embed":
+        globals()["info_embed"] = make_info_embed()
+        return globals()["info_embed"]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")